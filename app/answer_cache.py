@@ -0,0 +1,110 @@
+import os
+import itertools
+import threading
+import time
+from typing import List, Optional
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class SemanticAnswerCache:
+    """
+    Cache of RAG answers looked up by query-embedding similarity.
+
+    Each entry keeps the normalized query embedding, the retrieved chunks
+    (identified by source + content_hash so callers can check they are still
+    stored unchanged) and the LLM answer. A lookup returns the most similar
+    entry for the same search type and limit if its cosine similarity is at
+    least `threshold`. Entries expire after `ttl_seconds`, and the least
+    recently used entry is evicted beyond `capacity`.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, capacity: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.threshold = threshold or float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+        self.capacity = capacity or int(os.getenv("SEMANTIC_CACHE_CAPACITY", "512"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self._entries = []
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        values = np.asarray(vector, dtype=np.float32)
+        return values / (np.linalg.norm(values) or 1.0)
+
+    def lookup(self, query_vector, search_type: str, limit: int) -> Optional[dict]:
+        """Returns the best matching live entry above the threshold, or None."""
+        query = self._normalize(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            self._entries = [entry for entry in self._entries if entry["expires_at"] > now]
+            candidates = [
+                entry for entry in self._entries
+                if entry["search_type"] == search_type and entry["limit"] == limit
+            ]
+            best, best_similarity = None, self.threshold
+            if candidates:
+                similarities = np.stack([entry["vector"] for entry in candidates]) @ query
+                index = int(np.argmax(similarities))
+                if similarities[index] >= best_similarity:
+                    best, best_similarity = candidates[index], float(similarities[index])
+
+            if best is None:
+                self.misses += 1
+                return None
+            best["last_used"] = now
+            self.hits += 1
+            return {**best, "similarity": best_similarity}
+
+    def store(self, query_vector, search_type: str, limit: int, query: str, results: List[dict], answer: str):
+        """Adds an answer, evicting the least recently used entry when full."""
+        now = time.monotonic()
+        entry = {
+            "id": next(self._ids),
+            "vector": self._normalize(query_vector),
+            "search_type": search_type,
+            "limit": limit,
+            "query": query,
+            "results": results,
+            "chunks": [
+                {"source": hit.get("source"), "content_hash": hit.get("content_hash")}
+                for hit in results
+            ],
+            "answer": answer,
+            "expires_at": now + self.ttl_seconds,
+            "last_used": now
+        }
+        with self._lock:
+            self._entries.append(entry)
+            if len(self._entries) > self.capacity:
+                self._entries.remove(min(self._entries, key=lambda e: e["last_used"]))
+
+    def invalidate(self, entry: dict):
+        """Drops an entry whose chunks changed; the lookup that found it counts as a miss."""
+        with self._lock:
+            self.hits -= 1
+            self.misses += 1
+            self.invalidated += 1
+            self._entries = [e for e in self._entries if e["id"] != entry["id"]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidated": self.invalidated,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "capacity": self.capacity,
+                "threshold": self.threshold
+            }
+
+def semantic_cache_enabled() -> bool:
+    return os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+
+answer_cache = SemanticAnswerCache()
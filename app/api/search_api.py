@@ -1,24 +1,39 @@
-from fastapi import APIRouter, HTTPException, Query
-from app.database import MongoManager
-from app.embedding import get_embedding
-from typing import List, Dict, Any
+import os
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
+from app.database import AsyncMongoManager, DEFAULT_RESULT_FIELDS, RESULT_FIELDS, parse_result_fields
+from app.dependencies import get_async_mongo, get_vector_backend
+from app.query_cache import get_query_vector, get_query_vectors
+from app.retrieval import hybrid_search
+from typing import List, Dict, Any, Literal, Optional
 
 router = APIRouter(prefix="/search", tags=["search"])
 
+FIELDS_DESCRIPTION = (
+    f"Comma-separated result fields (default: {','.join(DEFAULT_RESULT_FIELDS)}; "
+    f"available: {','.join(RESULT_FIELDS)})"
+)
+
+def get_result_fields(fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)):
+    """Validates the `fields` query parameter shared by the search endpoints."""
+    try:
+        return parse_result_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/text")
 async def search_by_text(
     query: str = Query(..., description="The search query"),
-    limit: int = Query(5, ge=1, le=20)
+    limit: int = Query(5, ge=1, le=20),
+    fields: tuple = Depends(get_result_fields),
+    mongo: AsyncMongoManager = Depends(get_async_mongo)
 ):
     """
     Traditional MongoDB text search using $text index.
     """
-    mongo = MongoManager()
-    if not mongo.connect():
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
     try:
-        results = mongo.keyword_search(query, limit=limit)
+        results = await mongo.keyword_search(query, limit=limit, fields=fields)
         return {
             "query": query,
             "type": "text",
@@ -26,24 +41,20 @@ async def search_by_text(
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Text search failed: {str(e)}")
-    finally:
-        mongo.close()
 
 @router.get("/atlas")
 async def search_by_atlas(
     query: str = Query(..., description="The search query"),
-    limit: int = Query(5, ge=1, le=20)
+    limit: int = Query(5, ge=1, le=20),
+    fields: tuple = Depends(get_result_fields),
+    mongo: AsyncMongoManager = Depends(get_async_mongo)
 ):
     """
     Atlas Search using $search operator (requires Atlas Search index).
     """
     print('Starting atlas search')
-    mongo = MongoManager()
-    if not mongo.connect():
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
     try:
-        results = mongo.atlas_search(query, limit=limit)
+        results = await mongo.atlas_search(query, limit=limit, fields=fields)
         return {
             "query": query,
             "type": "atlas",
@@ -51,28 +62,27 @@ async def search_by_atlas(
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Atlas search failed: {str(e)}")
-    finally:
-        mongo.close()
 
 @router.get("/vector")
 async def search_by_vector(
     query: str = Query(..., description="The search query"),
     limit: int = Query(5, ge=1, le=20),
-    explain: bool = Query(False, description="Include execution statistics")
+    explain: bool = Query(False, description="Include execution statistics"),
+    mode: Optional[str] = Query(None, enum=["standard", "coarse_to_fine"], description="Retrieval mode (defaults to VECTOR_SEARCH_MODE)"),
+    fields: tuple = Depends(get_result_fields),
+    vector_backend = Depends(get_vector_backend)
 ):
     """
     Vector search using embeddings and $vectorSearch.
     """
-    mongo = MongoManager()
-    if not mongo.connect():
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
     try:
         # Generate embedding
-        raw_vector = get_embedding(query)
-        bson_vector = mongo.to_bson_vector(raw_vector)
+        raw_vector, bson_vector = await get_query_vector(query, vector_backend)
         
-        search_output = mongo.vector_search(bson_vector, limit=limit, include_explain=explain)
+        search_output = await vector_backend.vector_search(
+            bson_vector, limit=limit, include_explain=explain, rescore_vector=raw_vector,
+            coarse_to_fine=None if mode is None else mode == "coarse_to_fine", fields=fields
+        )
         
         if explain and isinstance(search_output, dict):
             return {
@@ -89,5 +99,101 @@ async def search_by_vector(
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Vector search failed: {str(e)}")
-    finally:
-        mongo.close()
+
+@router.get("/hybrid")
+async def search_hybrid(
+    query: str = Query(..., description="The search query"),
+    limit: int = Query(5, ge=1, le=20),
+    k: int = Query(60, ge=1, description="Reciprocal rank fusion constant"),
+    keyword_weight: float = Query(1.0, ge=0, description="Weight of the keyword ranking"),
+    vector_weight: float = Query(1.0, ge=0, description="Weight of the vector ranking"),
+    fields: tuple = Depends(get_result_fields),
+    mongo: AsyncMongoManager = Depends(get_async_mongo),
+    vector_backend = Depends(get_vector_backend)
+):
+    """
+    Hybrid search: runs $text and $vectorSearch retrieval concurrently and fuses
+    them with reciprocal rank fusion, deduplicated by source and chunk_index.
+    """
+    try:
+        results = await hybrid_search(
+            mongo, query, limit=limit, k=k,
+            keyword_weight=keyword_weight, vector_weight=vector_weight,
+            vector_backend=vector_backend, fields=fields
+        )
+        return {
+            "query": query,
+            "type": "hybrid",
+            "results": results
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Hybrid search failed: {str(e)}")
+
+class BatchQuery(BaseModel):
+    query: str
+    type: Literal["text", "atlas", "vector", "hybrid"] = "vector"
+    limit: int = Field(5, ge=1, le=20)
+    fields: Optional[str] = None
+
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchQuery] = Field(..., min_length=1)
+
+@router.post("/batch")
+async def search_batch(
+    request: BatchSearchRequest,
+    mongo: AsyncMongoManager = Depends(get_async_mongo),
+    vector_backend = Depends(get_vector_backend)
+):
+    """
+    Runs several searches (mixed text / atlas / vector / hybrid) in one request.
+    All queries needing an embedding are embedded with a single embedding call,
+    then every search runs concurrently over the shared connection pool.
+    Results come back in request order; a failing query reports its `error`
+    without failing the others.
+    """
+    max_queries = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "32"))
+    if len(request.queries) > max_queries:
+        raise HTTPException(status_code=400, detail=f"At most {max_queries} queries per batch")
+    try:
+        fields = [parse_result_fields(item.fields) for item in request.queries]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # One embedding request for every vector / hybrid query (hybrid then hits the query cache)
+    vector_queries = [item.query for item in request.queries if item.type in ("vector", "hybrid")]
+    embedded, embedding_error = {}, None
+    try:
+        embedded = dict(zip(vector_queries, await get_query_vectors(vector_queries, vector_backend)))
+    except Exception as e:
+        # Only the queries that need an embedding fail; text / atlas queries still run
+        embedding_error = f"Query embedding failed: {str(e)}"
+
+    async def run(item: BatchQuery, item_fields):
+        if embedding_error and item.type in ("vector", "hybrid"):
+            raise RuntimeError(embedding_error)
+        if item.type == "text":
+            return await mongo.keyword_search(item.query, limit=item.limit, fields=item_fields)
+        if item.type == "atlas":
+            return await mongo.atlas_search(item.query, limit=item.limit, fields=item_fields)
+        if item.type == "hybrid":
+            return await hybrid_search(
+                mongo, item.query, limit=item.limit, vector_backend=vector_backend, fields=item_fields
+            )
+        raw_vector, bson_vector = embedded[item.query]
+        return await vector_backend.vector_search(
+            bson_vector, limit=item.limit, rescore_vector=raw_vector, fields=item_fields
+        )
+
+    outcomes = await asyncio.gather(
+        *(run(item, item_fields) for item, item_fields in zip(request.queries, fields)),
+        return_exceptions=True
+    )
+    results = []
+    for item, outcome in zip(request.queries, outcomes):
+        entry = {"query": item.query, "type": item.type}
+        if isinstance(outcome, Exception):
+            entry["error"] = str(outcome)
+        else:
+            entry["results"] = outcome
+        results.append(entry)
+    return {"count": len(results), "results": results}
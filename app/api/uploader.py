@@ -1,88 +1,221 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
 import os
+import asyncio
+import multiprocessing
 import shutil
 import tempfile
-from docling.document_converter import DocumentConverter
-from scripts.chunking import get_docling_chunker, chunk_document, get_contextualized_text
-from app.embedding import get_embedding
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from docling_core.types.doc import DoclingDocument
+from scripts.chunking import get_docling_chunker
 from app.database import MongoManager
+from app.pipeline import IngestionPipeline
+from app.dependencies import get_mongo
+from app.jobs import JobQueue, QueueFullError
+from app.metrics import span
+from app.conversion_cache import file_sha256, get_conversion_cache
 
 router = APIRouter()
-converter = DocumentConverter()
-
-def sanitize_metadata(d):
-    """Helper to sanitize dict values for MongoDB"""
-    if isinstance(d, dict):
-        return {k: sanitize_metadata(v) for k, v in d.items()}
-    elif isinstance(d, list):
-        return [sanitize_metadata(v) for v in d]
-    elif isinstance(d, int):
-        # MongoDB 8 supports Int64, but if it exceeds that, cast to string
-        if d > 9223372036854775807 or d < -9223372036854775808:
-            return str(d)
-        return d
-    return d
-
-def save_vector_chunks(doc, filename: str):
-    """
-    Chunks the document, generates embeddings, and saves to MongoDB.
-    Returns the number of chunks processed.
-    """
-    mongo = MongoManager()
+_converter = None
+_converter_lock = threading.Lock()
+_process_pool = None
+
+class IndexingError(Exception):
+    """Raised when a document could not be fully indexed; `result` holds the pipeline counts, if any."""
+
+    def __init__(self, message: str, result: dict = None):
+        super().__init__(message)
+        self.result = result
+
+def get_converter():
+    """
+    Returns the process-wide Docling DocumentConverter, created on first use.
+    Each conversion worker process builds its own on its first job.
+    """
+    global _converter
+    if _converter is None:
+        with _converter_lock:
+            if _converter is None:
+                from docling.document_converter import DocumentConverter
+                _converter = DocumentConverter()
+    return _converter
+
+def index_document(doc, filename: str, mongo: MongoManager, progress=None, ensure_indexes: bool = True) -> dict:
+    """
+    Runs the streaming IngestionPipeline for one converted document on a
+    connected MongoManager and returns the pipeline result (chunk counts,
+    insert summary, per-stage throughput and errors). Batch callers that
+    already ensured the indexes can pass `ensure_indexes=False`.
+    """
+    print(f"Chunking document: {filename}")
+    chunker = get_docling_chunker()
+
+    if ensure_indexes:
+        # Ensure Vector Index exists (1536 for Gemini)
+        mongo.ensure_vector_indexes(dimensions=1536)
+
+    pipeline = IngestionPipeline(mongo, filename, progress=progress)
+    result = pipeline.run(doc, chunker)
+    if progress:
+        progress("inserted", chunks_total=result["chunks_total"])
+
+    if result["failed"] or result["errors"]:
+        print(f"Warning: indexing of {filename} incomplete: {result['errors'] or result['insert_errors']}")
+    print(
+        f"Indexed {result['inserted']} new chunks ({result['unchanged']} unchanged, "
+        f"{result['stale_removed']} stale removed) from {filename}. Stages: {result['stages']}"
+    )
+    return result
+
+def save_vector_chunks(doc, filename: str, mongo: MongoManager = None, progress=None):
+    """
+    Chunks the document, generates embeddings, and saves to MongoDB through the
+    streaming IngestionPipeline. Unchanged chunks of a re-uploaded source are kept,
+    only new ones are embedded and inserted, and stale ones are removed.
+    Uses the given (shared) MongoManager, or opens a short-lived one if omitted.
+    `progress(stage, **fields)` is called as the pipeline makes progress.
+    Returns the number of chunks indexed for the document.
+
+    Raises IndexingError if the document was only partially indexed (e.g. the
+    embedding API kept throttling past its retries), so callers can mark the
+    upload failed and retry it. Chunks that did get inserted are kept; the retry
+    only embeds the missing ones.
+    """
+    owns_connection = mongo is None
+    if owns_connection:
+        mongo = MongoManager()
     if not mongo.connect():
-        print("Failed to connect to MongoDB for chunking.")
-        return 0
+        raise IndexingError("Failed to connect to MongoDB for chunking.")
 
     try:
-        print(f"Chunking document: {filename}")
-        chunker = get_docling_chunker()
-        chunks = list(chunk_document(doc, chunker))
-        print(f"Found {len(chunks)} chunks.")
+        result = index_document(doc, filename, mongo, progress)
+        if result["failed"] or result["errors"]:
+            raise IndexingError(
+                f"{result['failed']} of {result['chunks_total']} chunks of {filename} were not indexed: "
+                f"{result['errors'] or result['insert_errors']}",
+                result
+            )
+        return result["unchanged"] + result["inserted"]
+    finally:
+        if owns_connection:
+            mongo.close()
 
-        # Ensure Vector Index exists (1536 for Gemini)
-        mongo.create_vector_index(dimensions=1536)
-
-        for i, chunk in enumerate(chunks):
-            print(f"Processing chunk {i+1}/{len(chunks)}...", end="\r")
-            
-            # Get context-enriched text for embedding
-            enriched_text = get_contextualized_text(chunk, chunker)
-            
-            # Generate embedding using Gemini
-            raw_vector = get_embedding(enriched_text)
-            
-            # Convert to BSON Binary vector for MongoDB 8.0
-            vector = mongo.to_bson_vector(raw_vector)
-            
-            # Prepare metadata and sanitize
-            metadata = chunk.meta.model_dump()
-            sanitized_meta = sanitize_metadata(metadata)
-            
-            # Prepare data for MongoDB
-            document_data = {
-                "text": chunk.text,
-                "enriched_text": enriched_text,
-                "vector": vector,
-                "metadata": sanitized_meta,
-                "source": filename,
-                "chunk_index": i
-            }
-            
-            # Insert into MongoDB
-            mongo.insert_chunk(document_data)
-        
-        print(f"\nSuccessfully indexed {len(chunks)} chunks from {filename} into MongoDB.")
-        return len(chunks)
-    except Exception as e:
-        print(f"Error in save_vector_chunks: {e}")
-        return 0
+def convert_workers() -> int:
+    """Conversion processes (CONVERT_PROCESS_WORKERS), one per CPU core by default."""
+    return int(os.getenv("CONVERT_PROCESS_WORKERS", str(os.cpu_count() or 2)))
+
+def new_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Creates a conversion process pool. Workers are spawned rather than forked:
+    the parent already runs PyMongo monitor threads and worker threads, and
+    forking a multi-threaded process can deadlock the child.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Returns the process pool used for CPU-bound Docling conversions."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = new_process_pool(convert_workers())
+    return _process_pool
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+def convert_file(file_path: str, include_markdown: bool = True):
+    """
+    Converts a file with Docling. Runs inside a worker process, so it returns
+    the document as a plain dict (plus its markdown, or None when
+    `include_markdown` is False) to cross the process boundary.
+    Results are cached on disk by the file's SHA-256, so the same bytes are
+    only converted once.
+    """
+    cache = get_conversion_cache()
+    file_hash = None
+    if cache is not None:
+        file_hash = file_sha256(file_path)
+        cached = cache.get(file_hash)
+        if cached is not None:
+            print(f"Conversion cache hit for {os.path.basename(file_path)} ({file_hash[:12]})")
+            document, markdown = cached
+            return document, markdown if include_markdown else None
+
+    result = get_converter().convert(file_path)
+    document = result.document.export_to_dict()
+    markdown = result.document.export_to_markdown() if include_markdown or cache is not None else None
+    if cache is not None:
+        try:
+            cache.put(file_hash, document, markdown)
+        except Exception as e:
+            print(f"Note: could not cache conversion of {os.path.basename(file_path)}: {e}")
+    return document, markdown if include_markdown else None
+
+def warm_converter():
+    """
+    Builds the converter and loads its PDF pipeline models. Runs inside a
+    worker process; returns the process id so callers can see which warmed up.
+    """
+    from docling.datamodel.base_models import InputFormat
+    get_converter().initialize_pipeline(InputFormat.PDF)
+    return os.getpid()
+
+def warm_ingestion() -> dict:
+    """
+    Loads the heavy ingestion dependencies ahead of the first upload: the
+    chunker's tokenizer in this process and the Docling models in every
+    conversion worker. Returns the seconds spent per component.
+    """
+    timings = {}
+    start = time.perf_counter()
+    get_docling_chunker()
+    timings["chunker"] = round(time.perf_counter() - start, 3)
+
+    # Submitting one task per worker at once makes the pool start all of them
+    start = time.perf_counter()
+    pool = get_process_pool()
+    futures = [pool.submit(warm_converter) for _ in range(convert_workers())]
+    workers = {future.result() for future in futures}
+    timings["converter"] = round(time.perf_counter() - start, 3)
+    timings["converter_workers"] = len(workers)
+    return timings
+
+async def process_conversion_job(job, progress):
+    """Job handler: converts the uploaded file, then chunks, embeds and indexes it."""
+    try:
+        progress("converting")
+        print(f"Starting conversion for {job['filename']}...")
+        loop = asyncio.get_running_loop()
+        with span("convert"):
+            doc_dict, markdown_content = await loop.run_in_executor(get_process_pool(), convert_file, job["_path"])
+            doc = DoclingDocument.model_validate(doc_dict)
+        print(f"Conversion successful for {job['filename']}")
+
+        mongo = get_mongo()
+        chunks_count = await asyncio.to_thread(save_vector_chunks, doc, job["filename"], mongo, progress)
+        return {
+            "markdown": markdown_content,
+            "chunks_indexed": chunks_count
+        }
     finally:
-        mongo.close()
+        shutil.rmtree(job["_temp_dir"], ignore_errors=True)
+
+def drop_markdown(result: dict) -> dict:
+    """Compacted result of an older job: the markdown is dropped, the counts are kept."""
+    return {**{k: v for k, v in result.items() if k != "markdown"}, "markdown_expired": True}
 
-@router.post("/convert")
+job_queue = JobQueue(process_conversion_job, compact_result=drop_markdown)
+
+@router.post("/convert", status_code=202)
 async def convert_to_md(file: UploadFile = File(...)):
     """
-    Receives a file from the frontend, prints its info, and converts it to markdown.
+    Receives a file from the frontend and enqueues it for conversion to markdown
+    and indexing. Returns a job id immediately; poll /jobs/{job_id} for progress.
     """
     # Print data for now as requested
     print(f"Received file: {file.filename}")
@@ -94,27 +227,100 @@ async def convert_to_md(file: UploadFile = File(...)):
     file.file.seek(0)
     print(f"File Size: {file_size} bytes")
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_file_path = os.path.join(temp_dir, file.filename)
+    # Reject before paying for the disk copy; submit() below still guards the race
+    if job_queue.free_slots() <= 0:
+        raise HTTPException(status_code=429, detail="Job queue is full", headers={"Retry-After": "30"})
+
+    # The temp dir outlives the request; the job handler removes it when done
+    temp_dir = tempfile.mkdtemp()
+    temp_file_path = os.path.join(temp_dir, os.path.basename(file.filename))
+    with open(temp_file_path, "wb") as buffer:
+        await asyncio.to_thread(shutil.copyfileobj, file.file, buffer)
+
+    try:
+        job = job_queue.submit(filename=file.filename, _path=temp_file_path, _temp_dir=temp_dir)
+    except QueueFullError as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+
+    return {
+        "message": "File accepted for processing",
+        "job_id": job["id"],
+        "filename": file.filename,
+        "status_url": f"/jobs/{job['id']}"
+    }
+
+@router.post("/convert/batch", status_code=202)
+async def convert_batch(files: List[UploadFile] = File(...)):
+    """
+    Enqueues several files at once. Each file becomes its own job (converted
+    in the process pool, indexed through the shared pipeline) tagged with a
+    common batch id; poll /batches/{batch_id} for aggregate progress. The
+    batch is accepted whole or rejected with 429 when the queue cannot hold it.
+    """
+    if len(files) > job_queue.free_slots():
+        raise HTTPException(
+            status_code=429,
+            detail=f"Job queue has room for {job_queue.free_slots()} files, batch has {len(files)}",
+            headers={"Retry-After": "30"}
+        )
+
+    batch_id = uuid.uuid4().hex
+    staged = []
+    for file in files:
+        temp_dir = tempfile.mkdtemp()
+        temp_file_path = os.path.join(temp_dir, os.path.basename(file.filename))
         with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        try:
-            print(f"Starting conversion for {file.filename}...")
-            result = converter.convert(temp_file_path)
-            markdown_content = result.document.export_to_markdown()
-            
-            print(f"Conversion successful for {file.filename}")
-
-            # NEW: Save chunks to vector database
-            chunks_count = save_vector_chunks(result.document, file.filename)
-            
-            return {
-                "message": "File processed successfully",
-                "filename": file.filename,
-                "markdown": markdown_content,
-                "chunks_indexed": chunks_count
-            }
-        except Exception as e:
-            print(f"Conversion failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+            await asyncio.to_thread(shutil.copyfileobj, file.file, buffer)
+        staged.append((file.filename, temp_file_path, temp_dir))
+
+    # Re-check after the uploads were written: other requests may have filled the queue
+    if len(staged) > job_queue.free_slots():
+        for _, _, temp_dir in staged:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        raise HTTPException(status_code=429, detail="Job queue filled up during upload", headers={"Retry-After": "30"})
+
+    jobs = [
+        job_queue.submit(filename=filename, batch_id=batch_id, _path=path, _temp_dir=temp_dir)
+        for filename, path, temp_dir in staged
+    ]
+    return {
+        "message": f"{len(jobs)} files accepted for processing",
+        "batch_id": batch_id,
+        "jobs": [{"job_id": job["id"], "filename": job["filename"]} for job in jobs],
+        "status_url": f"/batches/{batch_id}"
+    }
+
+@router.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """
+    Returns the per-status job counts, total chunks indexed and the jobs
+    (without their markdown) of a /convert/batch upload.
+    """
+    jobs = job_queue.find(batch_id=batch_id)
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    counts = {}
+    for job in jobs:
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+    return {
+        "batch_id": batch_id,
+        "total": len(jobs),
+        "status_counts": counts,
+        "chunks_indexed": sum(job["chunks_indexed"] or 0 for job in jobs),
+        "jobs": [
+            {k: v for k, v in job_queue.describe(job).items() if k != "result"}
+            for job in jobs
+        ]
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Returns the status, current stage and chunk counts of an ingestion job.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_queue.describe(job)
@@ -0,0 +1,133 @@
+import os
+from functools import lru_cache
+from typing import Callable, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Same tokenizer as scripts.chunking.get_docling_chunker, so the budget is
+# measured in the units the chunks were sized in
+TOKENIZER_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+def context_max_tokens() -> int:
+    return int(os.getenv("RAG_CONTEXT_MAX_TOKENS", "2000"))
+
+@lru_cache(maxsize=None)
+def get_token_counter(tokenizer_model: str = TOKENIZER_MODEL) -> Callable[[str], int]:
+    """
+    Returns a function counting the tokens of a text with the chunker's
+    Hugging Face tokenizer, loaded on first use. Falls back to an estimate of
+    ~4 characters per token where transformers is not installed (e.g. a
+    search-only image), so search replicas never need the ingestion stack.
+    """
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_model)
+    except Exception as e:
+        print(f"Tokenizer {tokenizer_model} unavailable ({e}); estimating context tokens from length.")
+        return lambda text: max(1, len(text) // 4)
+    return lambda text: len(tokenizer.tokenize(text))
+
+def dedupe_results(results: List[dict]) -> List[dict]:
+    """
+    Drops repeated hits, keeping the best-ranked one: the same chunk
+    (source, chunk_index), the same whole text from any source, or a text
+    contained in a better-ranked hit of the same source (e.g. a chunk that
+    is repeated inside a larger one). Short texts are never matched as
+    substrings of other documents' chunks.
+    """
+    kept = []
+    seen_chunks = set()
+    seen_texts = set()
+    for res in results:
+        text = (res.get("text") or "").strip()
+        key = (res.get("source"), res.get("chunk_index"))
+        if not text or key in seen_chunks or text in seen_texts:
+            continue
+        if any(other.get("source") == key[0] and text in other["text"] for other in kept):
+            continue
+        seen_chunks.add(key)
+        seen_texts.add(text)
+        kept.append({**res, "text": text})
+    return kept
+
+def merge_neighbors(results: List[dict]) -> List[dict]:
+    """
+    Merges hits with consecutive chunk_index values from the same source into
+    one passage, so adjacent chunks read as continuous text instead of
+    separate fragments. Passages keep the rank of their best hit.
+    """
+    merged = []
+    by_source = {}
+    for rank, res in enumerate(results):
+        if res.get("source") is None or res.get("chunk_index") is None:
+            # Can't be placed in its document; stays a passage of its own
+            merged.append({"rank": rank, "source": res.get("source"), "chunk_indexes": [], "texts": [res["text"]]})
+        else:
+            by_source.setdefault(res["source"], []).append((res["chunk_index"], rank, res["text"]))
+
+    for source, hits in by_source.items():
+        run = None
+        for index, rank, text in sorted(hits):
+            if run is not None and index == run["chunk_indexes"][-1] + 1:
+                run["chunk_indexes"].append(index)
+                run["texts"].append(text)
+                run["rank"] = min(run["rank"], rank)
+            else:
+                run = {"rank": rank, "source": source, "chunk_indexes": [index], "texts": [text]}
+                merged.append(run)
+
+    merged.sort(key=lambda passage: passage["rank"])
+    for passage in merged:
+        passage["text"] = "\n".join(passage.pop("texts"))
+    return merged
+
+def truncate_to_tokens(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """Longest word-boundary prefix of `text` within max_tokens (binary search over words)."""
+    words = text.split(" ")
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low])
+
+def build_context(results: List[dict], max_tokens: Optional[int] = None,
+                  count_tokens: Optional[Callable[[str], int]] = None) -> List[dict]:
+    """
+    Turns ranked search results into the passages sent to the LLM: deduplicated,
+    neighbor-merged and packed best-first into a budget of `max_tokens`
+    (RAG_CONTEXT_MAX_TOKENS). A passage that doesn't fit is skipped in favor
+    of smaller lower-ranked ones, except that the first passage is truncated
+    rather than dropped. Each passage carries its token count in `tokens`.
+    """
+    max_tokens = max_tokens or context_max_tokens()
+    count_tokens = count_tokens or get_token_counter()
+
+    selected = []
+    used = 0
+    for passage in merge_neighbors(dedupe_results(results)):
+        tokens = count_tokens(passage["text"])
+        if used + tokens > max_tokens:
+            if selected:
+                continue
+            passage["text"] = truncate_to_tokens(passage["text"], max_tokens, count_tokens)
+            tokens = count_tokens(passage["text"])
+        passage["tokens"] = tokens
+        selected.append(passage)
+        used += tokens
+    return selected
+
+def format_context(passages: List[dict]) -> str:
+    """Formats passages as numbered sources for the prompt."""
+    blocks = []
+    for i, passage in enumerate(passages):
+        label = f"Source {i+1}"
+        if passage["source"]:
+            indexes = passage["chunk_indexes"]
+            location = f", chunks {indexes[0]}-{indexes[-1]}" if len(indexes) > 1 else ""
+            label += f" ({passage['source']}{location})"
+        blocks.append(f"{label}:\n{passage['text']}")
+    return "\n\n".join(blocks)
@@ -0,0 +1,110 @@
+import os
+import gzip
+import hashlib
+import json
+import tempfile
+import time
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def docling_version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("docling")
+    except Exception:
+        return "unknown"
+
+class ConversionCache:
+    """
+    On-disk cache of Docling conversion results, keyed by the SHA-256 of the
+    source file (plus the Docling version, so an upgrade re-converts).
+
+    Each entry is one gzipped JSON file holding the serialized DoclingDocument
+    and its markdown, written atomically so several conversion worker
+    processes can share the directory. Hits refresh the file's mtime, and once
+    the directory exceeds `max_bytes` the least recently used entries are
+    deleted.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = path or os.getenv("CONVERSION_CACHE_PATH", ".cache/conversions")
+        self.max_bytes = max_bytes or int(os.getenv("CONVERSION_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+        self.version = docling_version()
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entry_path(self, file_hash: str) -> str:
+        return os.path.join(self.path, f"{file_hash}-{self.version}.json.gz")
+
+    def get(self, file_hash: str) -> Optional[Tuple[dict, str]]:
+        """Returns (document dict, markdown) for a file hash, or None on a miss."""
+        entry_path = self._entry_path(file_hash)
+        try:
+            with gzip.open(entry_path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(entry_path)
+        except (FileNotFoundError, OSError, json.JSONDecodeError):
+            return None
+        return entry["document"], entry["markdown"]
+
+    def put(self, file_hash: str, document: dict, markdown: str):
+        """Stores a conversion result, then evicts old entries beyond max_bytes."""
+        fd, temp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+                json.dump({"document": document, "markdown": markdown, "created_at": time.time()}, f)
+            os.replace(temp_path, self._entry_path(file_hash))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.endswith(".json.gz"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        if total <= self.max_bytes:
+            return
+
+        for _, size, entry_path in sorted(entries):
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass  # Evicted concurrently by another worker
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> dict:
+        sizes = [entry.stat().st_size for entry in os.scandir(self.path) if entry.name.endswith(".json.gz")]
+        return {"entries": len(sizes), "bytes": sum(sizes), "max_bytes": self.max_bytes}
+
+def conversion_cache_enabled() -> bool:
+    return os.getenv("CONVERSION_CACHE_ENABLED", "true").lower() == "true"
+
+_conversion_cache: Optional[ConversionCache] = None
+
+def get_conversion_cache() -> Optional[ConversionCache]:
+    """Returns this process's ConversionCache, or None when disabled."""
+    global _conversion_cache
+    if not conversion_cache_enabled():
+        return None
+    if _conversion_cache is None:
+        _conversion_cache = ConversionCache()
+    return _conversion_cache
@@ -0,0 +1,32 @@
+from fastapi import HTTPException
+from app.database import AsyncMongoManager, MongoManager
+from app.local_vector_store import AsyncLocalVectorStore, get_local_vector_store
+
+# Process-wide MongoDB managers. Their clients own the connection pools and
+# are connected once in the app startup hook, then shared by every router.
+# The sync manager serves ingestion and index management; the async manager
+# serves search and RAG handlers on the event loop.
+mongo = MongoManager()
+async_mongo = AsyncMongoManager()
+
+def get_mongo() -> MongoManager:
+    """FastAPI dependency returning the shared, pooled MongoManager."""
+    if mongo.collection is None and not mongo.connect():
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    return mongo
+
+async def get_async_mongo() -> AsyncMongoManager:
+    """FastAPI dependency returning the shared, pooled AsyncMongoManager."""
+    if async_mongo.collection is None and not await async_mongo.connect():
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    return async_mongo
+
+async def get_vector_backend():
+    """
+    FastAPI dependency returning the engine that serves vector search:
+    the local in-process store when VECTOR_SEARCH_BACKEND=local, else MongoDB.
+    """
+    store = get_local_vector_store()
+    if store is not None:
+        return AsyncLocalVectorStore(store)
+    return await get_async_mongo()
@@ -1,4 +1,9 @@
 import os
+import asyncio
+import hashlib
+import threading
+import time
+import numpy as np
 from google import genai
 from typing import List, Union, Optional
 from dotenv import load_dotenv
@@ -7,12 +12,203 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from google.genai import types
+from app.embedding_cache import EmbeddingCache
+from app.rate_limiter import BULK, INTERACTIVE, estimate_tokens, get_scheduler
+
+DEFAULT_EMBEDDING_MODEL = "gemini-embedding-001"
+DEFAULT_OUTPUT_DIMENSIONALITY = 1536
+
+class EmbeddingService:
+    """
+    Owns a single long-lived Google GenAI client and exposes sync and async
+    embedding calls on top of it, so we don't pay client construction and
+    connection setup on every chunk or query.
+
+    API calls go through the shared "embedding" RateLimitScheduler, which
+    enforces the RPM/TPM budgets and retries throttled requests; query
+    embeddings (`embed`) take priority over ingestion batches (`embed_sync`).
+    """
+
+    def __init__(
+        self,
+        model: str = DEFAULT_EMBEDDING_MODEL,
+        api_key: Optional[str] = None,
+        output_dimensionality: int = DEFAULT_OUTPUT_DIMENSIONALITY,
+        cache: Optional[EmbeddingCache] = None
+    ):
+        self.model = model
+        self.output_dimensionality = output_dimensionality
+        self.cache = cache
+        self.client = genai.Client(api_key=api_key or os.getenv("GOOGLE_API_KEY"))
+
+    def _request(self, model: Optional[str], output_dimensionality: Optional[int]):
+        return dict(
+            model=model or self.model,
+            config=types.EmbedContentConfig(
+                output_dimensionality=output_dimensionality or self.output_dimensionality
+            )
+        )
+
+    def _call_sync(self, contents, model, output_dimensionality, priority):
+        return get_scheduler("embedding").run_sync(
+            lambda: self.client.models.embed_content(
+                contents=contents, **self._request(model, output_dimensionality)
+            ),
+            priority=priority,
+            tokens=estimate_tokens(contents)
+        )
+
+    @staticmethod
+    def _unpack(contents, result):
+        # The SDK returns a list of embeddings
+        embeddings = [item.values for item in result.embeddings]
+        if isinstance(contents, str):
+            return embeddings[0]
+        return embeddings
+
+    def embed_sync(
+        self,
+        contents: Union[str, List[str]],
+        model: Optional[str] = None,
+        output_dimensionality: Optional[int] = None,
+        priority: str = BULK
+    ) -> Union[List[float], List[List[float]]]:
+        """
+        Blocking embedding call, for scripts and worker threads.
+        Consults the on-disk cache (if configured) and only sends misses to the API.
+        """
+        if self.cache is None:
+            result = self._call_sync(contents, model, output_dimensionality, priority)
+            return self._unpack(contents, result)
+
+        model = model or self.model
+        output_dimensionality = output_dimensionality or self.output_dimensionality
+        texts = [contents] if isinstance(contents, str) else list(contents)
+
+        cached = self.cache.get_many(texts, model, output_dimensionality)
+        missing = [i for i in range(len(texts)) if i not in cached]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            result = self._call_sync(missing_texts, model, output_dimensionality, priority)
+            fresh = self._unpack(missing_texts, result)
+            self.cache.put_many(missing_texts, fresh, model, output_dimensionality)
+            cached.update(zip(missing, fresh))
+
+        embeddings = [cached[i] for i in range(len(texts))]
+        if isinstance(contents, str):
+            return embeddings[0]
+        return embeddings
+
+    async def embed(
+        self,
+        contents: Union[str, List[str]],
+        model: Optional[str] = None,
+        output_dimensionality: Optional[int] = None,
+        max_retries: Optional[int] = None
+    ) -> Union[List[float], List[List[float]]]:
+        """
+        Non-blocking embedding call using the client's `aio` variant, for request
+        handlers. `max_retries` overrides the scheduler's retry count.
+        """
+        result = await get_scheduler("embedding").run(
+            lambda: self.client.aio.models.embed_content(
+                contents=contents, **self._request(model, output_dimensionality)
+            ),
+            priority=INTERACTIVE,
+            tokens=estimate_tokens(contents),
+            max_retries=max_retries
+        )
+        return self._unpack(contents, result)
+
+    def close(self):
+        """Closes the underlying client connections and the cache."""
+        try:
+            self.client.close()
+        except Exception as e:
+            print(f"Note: Embedding client close info: {e}")
+        if self.cache is not None:
+            self.cache.close()
+
+class FakeEmbeddingService:
+    """
+    Deterministic offline stand-in for EmbeddingService (EMBEDDING_BACKEND=fake),
+    for benchmarks and development without API access. Each text maps to a
+    unit vector drawn from a generator seeded with its SHA-256, so the same text
+    always gets the same embedding. FAKE_EMBEDDING_LATENCY_MS simulates the
+    API round trip per call.
+    """
+
+    def __init__(self, model: str = "fake", output_dimensionality: int = DEFAULT_OUTPUT_DIMENSIONALITY,
+                 latency_ms: Optional[float] = None):
+        self.model = model
+        self.output_dimensionality = output_dimensionality
+        self.latency_ms = latency_ms if latency_ms is not None else float(os.getenv("FAKE_EMBEDDING_LATENCY_MS", "0"))
+        self.cache = None
+
+    def _vector(self, text: str, dimensions: int) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        values = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+        return (values / np.linalg.norm(values)).tolist()
+
+    def _embed(self, contents, output_dimensionality):
+        dimensions = output_dimensionality or self.output_dimensionality
+        if isinstance(contents, str):
+            return self._vector(contents, dimensions)
+        return [self._vector(text, dimensions) for text in contents]
+
+    def embed_sync(self, contents, model=None, output_dimensionality=None, priority=BULK):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._embed(contents, output_dimensionality)
+
+    async def embed(self, contents, model=None, output_dimensionality=None, max_retries=None):
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._embed(contents, output_dimensionality)
+
+    def close(self):
+        pass
+
+_embedding_service: Optional[EmbeddingService] = None
+_embedding_service_lock = threading.Lock()
+
+def get_embedding_service() -> EmbeddingService:
+    """Returns the process-wide EmbeddingService, creating it on first use."""
+    global _embedding_service
+    if _embedding_service is None:
+        with _embedding_service_lock:
+            if _embedding_service is None and os.getenv("EMBEDDING_BACKEND", "gemini").lower() == "fake":
+                _embedding_service = FakeEmbeddingService()
+            if _embedding_service is None:
+                cache = None
+                if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true":
+                    cache = EmbeddingCache()
+                _embedding_service = EmbeddingService(cache=cache)
+    return _embedding_service
+
+def close_embedding_service():
+    """Closes and discards the process-wide EmbeddingService."""
+    global _embedding_service
+    with _embedding_service_lock:
+        if _embedding_service is not None:
+            _embedding_service.close()
+            _embedding_service = None
+
+def embedding_cache_stats() -> Optional[dict]:
+    """
+    Hit/miss counters of the on-disk embedding cache, or None when the cache is
+    disabled or the embedding service has not been created yet.
+    """
+    service = _embedding_service
+    if service is None or service.cache is None:
+        return None
+    return service.cache.stats()
 
 def get_embedding(
     contents: Union[str, List[str]], 
-    model: str = "gemini-embedding-001",
+    model: str = DEFAULT_EMBEDDING_MODEL,
     api_key: Optional[str] = None,
-    output_dimensionality: int = 1536
+    output_dimensionality: int = DEFAULT_OUTPUT_DIMENSIONALITY
 ) -> Union[List[float], List[List[float]]]:
     """
     Generates embeddings for the given content using the Google GenAI SDK.
@@ -20,30 +216,25 @@ def get_embedding(
     Args:
         contents: A single string or a list of strings to embed.
         model: The Google embedding model to use. Defaults to "gemini-embedding-001".
-        api_key: Optional API key. If not provided, it will look for GOOGLE_API_KEY env var.
+        api_key: Optional API key. If not provided, the shared EmbeddingService
+                 (configured from the GOOGLE_API_KEY env var) is used.
         output_dimensionality: The size of the output embedding vector. Defaults to 1536.
         
     Returns:
         A list of floats (if single string) or a list of lists of floats (if multiple strings).
     """
-    client = genai.Client(api_key=api_key or os.getenv("GOOGLE_API_KEY"))
-    
-    result = client.models.embed_content(
-        model=model,
-        contents=contents,
-        config=types.EmbedContentConfig(output_dimensionality=output_dimensionality)
-    )
-    
-    # The SDK returns a list of embeddings
-    embeddings = [item.values for item in result.embeddings]
-    
-    if isinstance(contents, str):
-        return embeddings[0]
-    
-    return embeddings
+    if api_key is not None:
+        service = EmbeddingService(api_key=api_key)
+        try:
+            return service.embed_sync(contents, model=model, output_dimensionality=output_dimensionality)
+        finally:
+            service.close()
+
+    return get_embedding_service().embed_sync(contents, model=model, output_dimensionality=output_dimensionality)
 
 if __name__ == "__main__":
-    # Test block for easy verification and Jupyter usage
+    # Test block for easy verification and Jupyter usage.
+    # Run from the project root as a module: python -m app.embedding
     test_text = "Hello world, this is a test of the Gemini embedding system."
     try:
         vector = get_embedding(test_text)
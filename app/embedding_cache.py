@@ -0,0 +1,117 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class EmbeddingCache:
+    """
+    Content-addressed, persistent embedding cache backed by SQLite.
+
+    Entries are keyed by a SHA-256 of (model, output_dimensionality, text) and
+    stored as packed float32 vectors. The cache is bounded by `max_entries` and
+    evicts the least recently used rows once the limit is exceeded.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+        self.max_entries = max_entries or int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(text: str, model: str, output_dimensionality: int) -> str:
+        """Returns the content hash used as the cache key."""
+        payload = f"{model}\x00{output_dimensionality}\x00{text}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get_many(self, texts: List[str], model: str, output_dimensionality: int) -> Dict[int, List[float]]:
+        """
+        Looks up the given texts. Returns a dict mapping the position of each
+        cached text to its vector; positions missing from the dict are misses.
+        """
+        keys = [self.make_key(t, model, output_dimensionality) for t in texts]
+        found = {}
+        with self._lock:
+            unique_keys = list(set(keys))
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            result = {i: found[key] for i, key in enumerate(keys) if key in found}
+            self.hits += len(result)
+            self.misses += len(keys) - len(result)
+        return result
+
+    def put_many(self, texts: List[str], vectors: List[List[float]], model: str, output_dimensionality: int):
+        """Stores vectors for the given texts and evicts LRU entries above the size bound."""
+        now = time.time()
+        rows = [
+            (self.make_key(t, model, output_dimensionality), array("f", v).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current number of entries."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "entries": entries,
+                "max_entries": self.max_entries
+            }
+
+    def close(self):
+        """Closes the SQLite connection."""
+        with self._lock:
+            self._conn.close()
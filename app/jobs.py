@@ -0,0 +1,148 @@
+import os
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its maximum depth."""
+
+class JobQueue:
+    """
+    Bounded in-process job queue with a fixed number of asyncio workers.
+
+    Jobs are plain dicts (so they can be returned as JSON as-is) tracking a
+    `status`, the current `stage`, chunk counters and timestamps. The handler
+    receives the job dict and a `progress(stage, **fields)` callback.
+
+    Finished jobs stay queryable up to `history_limit`, but only the latest
+    `result_retention` keep their full result; older ones are passed through
+    `compact_result` so large payloads don't accumulate in memory.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict, Callable], Awaitable[Optional[dict]]],
+        max_depth: Optional[int] = None,
+        workers: Optional[int] = None,
+        history_limit: Optional[int] = None,
+        result_retention: Optional[int] = None,
+        compact_result: Optional[Callable[[dict], dict]] = None
+    ):
+        self.handler = handler
+        self.max_depth = max_depth or int(os.getenv("JOB_QUEUE_MAX_DEPTH", "16"))
+        # One job per core by default, so conversions can keep every process of the pool busy
+        self.workers = workers or int(os.getenv("JOB_WORKERS", str(os.cpu_count() or 2)))
+        self.history_limit = history_limit or int(os.getenv("JOB_HISTORY_LIMIT", "1000"))
+        self.result_retention = (
+            result_retention if result_retention is not None else int(os.getenv("JOB_RESULT_RETENTION", "32"))
+        )
+        self.compact_result = compact_result
+        self.jobs = OrderedDict()
+        self._full_results = deque()  # ids of finished jobs still holding their full result
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        """Starts the worker tasks. Must be called from the running event loop."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_depth)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancels the worker tasks."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, **payload) -> dict:
+        """
+        Enqueues a new job and returns its record.
+        Raises QueueFullError when the queue is at its maximum depth.
+        """
+        if self._queue is None:
+            raise RuntimeError("JobQueue has not been started")
+
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "stage": "queued",
+            "chunks_total": None,
+            "chunks_indexed": 0,
+            "error": None,
+            "result": None,
+            "created_at": now,
+            "updated_at": now,
+            **payload
+        }
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.max_depth} pending jobs)")
+
+        self.jobs[job["id"]] = job
+        self._trim_history()
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+    @staticmethod
+    def describe(job: dict) -> dict:
+        """Returns the public view of a job (fields starting with '_' are internal)."""
+        return {k: v for k, v in job.items() if not k.startswith("_")}
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def free_slots(self) -> int:
+        """Number of jobs that can still be submitted before the queue is full."""
+        return self.max_depth - self.pending()
+
+    def find(self, **fields) -> list:
+        """Returns the known jobs whose fields match all of `fields` (e.g. batch_id)."""
+        return [job for job in self.jobs.values() if all(job.get(k) == v for k, v in fields.items())]
+
+    def _trim_history(self):
+        # Forget the oldest finished jobs once we keep more than history_limit
+        excess = len(self.jobs) - self.history_limit
+        for job_id in list(self.jobs):
+            if excess <= 0:
+                break
+            if self.jobs[job_id]["status"] in ("done", "failed"):
+                del self.jobs[job_id]
+                excess -= 1
+
+    def _retain_result(self, job: dict):
+        if self.compact_result is None or job["result"] is None:
+            return
+        self._full_results.append(job["id"])
+        while len(self._full_results) > self.result_retention:
+            old = self.jobs.get(self._full_results.popleft())
+            if old is not None and old["result"] is not None:
+                old["result"] = self.compact_result(old["result"])
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+
+            def progress(stage, **fields):
+                job.update(stage=stage, updated_at=time.time(), **fields)
+
+            job.update(status="running", updated_at=time.time())
+            try:
+                job["result"] = await self.handler(job, progress)
+                job.update(status="done", stage="done", updated_at=time.time())
+                self._retain_result(job)
+            except Exception as e:
+                print(f"Job {job['id']} failed: {e}")
+                job.update(status="failed", error=str(e), updated_at=time.time())
+            finally:
+                self._queue.task_done()
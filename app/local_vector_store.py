@@ -0,0 +1,419 @@
+import os
+import asyncio
+import json
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+import numpy as np
+from bson.binary import Binary, BinaryVectorDtype
+from dotenv import load_dotenv
+from app.database import parse_result_fields
+from app.metrics import span
+
+load_dotenv()
+
+try:
+    # Optional: approximate search over an HNSW graph instead of a flat scan
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+try:
+    # Cross-process locking of the store files (POSIX only)
+    import fcntl
+except ImportError:
+    fcntl = None
+
+def to_float32(vector) -> np.ndarray:
+    """Converts a BSON Binary vector, list or array into a float32 NumPy vector."""
+    if isinstance(vector, Binary):
+        vector = vector.as_vector().data
+    return np.asarray(vector, dtype=np.float32)
+
+# Chunk fields kept next to each vector (the searchable result fields)
+STORED_FIELDS = (
+    "text", "source", "chunk_index", "page", "pages", "headings", "captions",
+    "content_hash", "document_id", "metadata"
+)
+
+class LocalVectorStore:
+    """
+    In-process vector search engine, usable where MongoDB's mongot / HNSW
+    index is not available (dev, CI, edge nodes).
+
+    Vectors are kept as a contiguous float32 matrix in `vectors.f32`, memory
+    mapped from disk and appended to on insert. Chunk fields live in
+    `chunks.jsonl`, an append-only log of add / move / delete operations that is
+    replayed on load (row i of the matrix is the i-th add). Rows are stored
+    L2-normalized so top-k is a single matrix-vector product. When `hnswlib` is
+    installed and LOCAL_VECTOR_INDEX=hnsw, queries go through an HNSW graph.
+
+    Several processes may share a store (the API server and the indexing
+    scripts): every write happens under an exclusive `flock` on `.lock`, after
+    first replaying whatever other processes appended to the log, and searches
+    catch up with the log whenever it changed on disk. The log starts with an
+    `init` entry carrying a generation id; a rebuild swaps in files with a new
+    generation, which makes the other processes reload from scratch.
+
+    `vector_search` mirrors MongoManager.vector_search, including the
+    (1 + cosine) / 2 score MongoDB reports for cosine similarity.
+    """
+
+    def __init__(self, path: Optional[str] = None, dimensions: int = 1536, index_type: Optional[str] = None):
+        self.path = path or os.getenv("LOCAL_VECTOR_STORE_PATH", ".cache/local_vectors")
+        self.dimensions = dimensions
+        self.index_type = (index_type or os.getenv("LOCAL_VECTOR_INDEX", "flat")).lower()
+        if self.index_type == "hnsw" and hnswlib is None:
+            print("Note: hnswlib is not installed, falling back to flat local vector search.")
+            self.index_type = "flat"
+        if fcntl is None:
+            print("Note: fcntl is unavailable; don't share the local vector store between processes.")
+
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.log_path = os.path.join(self.path, "chunks.jsonl")
+        self.lock_path = os.path.join(self.path, ".lock")
+        self.generation = None
+        self._log_offset = 0    # bytes of the log replayed by this process
+        self._log_state = None  # (inode, size, mtime) of the log when last replayed
+        self.rows = []          # chunk fields per matrix row
+        self.row_by_id = {}     # Mongo _id (str) -> row
+        self.alive = np.zeros(0, dtype=bool)
+        self.matrix = np.zeros((0, dimensions), dtype=np.float32)
+        self._hnsw = None
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self.load()
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock on the store files shared with other processes. Hold self._lock first."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _stat_log(self):
+        try:
+            stat = os.stat(self.log_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def load(self):
+        """Memory-maps the vector file and replays the chunk log."""
+        with self._lock, self._file_lock():
+            self._load()
+
+    def _load(self):
+        """
+        Full reload; holds both locks. Vectors are written before their log
+        entries, so after a crash in between the vector file is truncated back
+        to the logged rows (as is a torn last log line); otherwise later appends
+        would be misaligned with the log.
+        """
+        self.rows, self.row_by_id = [], {}
+        self.generation = None
+        valid_bytes = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b"\n"):
+                        break
+                    self._replay(op)
+                    valid_bytes += len(line)
+            if valid_bytes != os.path.getsize(self.log_path):
+                print("Note: discarding a torn entry at the end of the local vector store log.")
+                os.truncate(self.log_path, valid_bytes)
+        if not valid_bytes:
+            self.generation = uuid.uuid4().hex
+            self._append_log([{"op": "init", "generation": self.generation}])
+
+        expected_bytes = len(self.rows) * self.dimensions * 4
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) > expected_bytes:
+            print("Note: discarding unlogged vectors at the end of the local vector store.")
+            os.truncate(self.vectors_path, expected_bytes)
+        self._remap()
+        self.alive = np.array([not row.get("_deleted") for row in self.rows], dtype=bool)
+        self._hnsw = None
+        self._log_state = self._stat_log()
+        self._log_offset = self._log_state[1]
+
+    def _log_generation(self):
+        with open(self.log_path, "rb") as f:
+            try:
+                op = json.loads(f.readline())
+            except ValueError:
+                return None
+        return op.get("generation") if op.get("op") == "init" else None
+
+    def _catch_up(self):
+        """
+        Replays log entries appended by other processes since this process last
+        read the log, or reloads if the store was rebuilt. Holds both locks.
+        """
+        state = self._stat_log()
+        if state == self._log_state:
+            return
+        if state is None or state[1] < self._log_offset or self._log_generation() != self.generation:
+            self._load()
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_offset)
+            lines = f.readlines()
+        try:
+            ops = [json.loads(line) for line in lines]
+        except ValueError:
+            self._load()
+            return
+        self._apply(ops)
+        self._log_offset += sum(len(line) for line in lines)
+        self._log_state = self._stat_log()
+
+    def _refresh(self):
+        """Catches up with other processes' writes if the log changed on disk. Holds self._lock."""
+        if self._stat_log() != self._log_state:
+            with self._file_lock():
+                self._catch_up()
+
+    def _replay(self, op):
+        if op["op"] == "init":
+            self.generation = op["generation"]
+        elif op["op"] == "add":
+            self.row_by_id[op["chunk"]["_id"]] = len(self.rows)
+            self.rows.append(op["chunk"])
+        elif op["op"] in ("move", "delete"):
+            row = self.row_by_id.get(op["_id"])
+            if row is None:
+                return
+            if op["op"] == "move":
+                self.rows[row]["chunk_index"] = op["chunk_index"]
+            else:
+                self.rows[row]["_deleted"] = True
+
+    def _apply(self, ops):
+        """Replays ops onto the in-memory state: rows, matrix view, alive mask and HNSW graph."""
+        first_row = len(self.rows)
+        for op in ops:
+            self._replay(op)
+        added = len(self.rows) - first_row
+        if added:
+            self._remap()
+            self.alive = np.concatenate([self.alive, np.ones(added, dtype=bool)])
+            if self._hnsw is not None:
+                self._hnsw_add(np.asarray(self.matrix[first_row:]), np.arange(first_row, len(self.rows)))
+        for op in ops:
+            if op["op"] == "delete":
+                row = self.row_by_id.get(op["_id"])
+                if row is not None and self.alive[row]:
+                    self.alive[row] = False
+                    if self._hnsw is not None:
+                        self._hnsw.mark_deleted(row)
+
+    def _remap(self):
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path):
+            matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r")
+            self.matrix = matrix.reshape(-1, self.dimensions)[:len(self.rows)]
+        else:
+            self.matrix = np.zeros((0, self.dimensions), dtype=np.float32)
+
+    def _append_log(self, ops):
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps(op, default=str) + "\n")
+
+    def _write(self, ops, vectors=None):
+        """Appends vectors and log entries after catching up with other writers. Holds both locks."""
+        self._catch_up()
+        if vectors is not None:
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.astype(np.float32).tobytes())
+        self._append_log(ops)
+        self._apply(ops)
+        self._log_state = self._stat_log()
+        self._log_offset = self._log_state[1]
+
+    def add(self, documents: List[dict]):
+        """
+        Appends chunk documents (as inserted into MongoDB, with a `vector` field)
+        to the store.
+        """
+        if not documents:
+            return
+        # Prefer the full-precision copy when the indexed vector is quantized
+        vectors = np.stack([to_float32(doc.get("vector_full", doc["vector"])) for doc in documents])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        chunks = [
+            {
+                "_id": str(doc.get("_id")),
+                **{field: doc[field] for field in STORED_FIELDS if doc.get(field) is not None}
+            }
+            for doc in documents
+        ]
+        for chunk in chunks:
+            if "document_id" in chunk:
+                chunk["document_id"] = str(chunk["document_id"])
+        with self._lock, self._file_lock():
+            self._write([{"op": "add", "chunk": chunk} for chunk in chunks], vectors)
+
+    def apply_source_diff(self, plan):
+        """Mirrors MongoManager.apply_source_diff: moves and deletes chunks by _id."""
+        ops = [{"op": "move", "_id": str(_id), "chunk_index": index} for _id, index in plan["reindex"]]
+        ops += [{"op": "delete", "_id": str(_id)} for _id in plan["stale"]]
+        if not ops:
+            return
+        with self._lock, self._file_lock():
+            self._write(ops)
+
+    def rebuild_from_mongo(self, mongo, batch_size: int = 1000):
+        """
+        Replaces the store contents with the vectors currently stored in MongoDB.
+        The new store is built in a sibling directory and swapped in under the
+        file lock, so processes using the store keep searching the old files
+        until they see the new generation. Chunks other processes add during the
+        rebuild are in MongoDB, but only reach the rebuilt store if they were
+        already there when the rebuild read them.
+        """
+        staging_path = self.path.rstrip(os.sep) + ".rebuild"
+        shutil.rmtree(staging_path, ignore_errors=True)
+        staging = LocalVectorStore(staging_path, dimensions=self.dimensions, index_type="flat")
+
+        batch = []
+        cursor = mongo.collection.find(
+            {"vector": {"$exists": True}},
+            {"_id": 1, "vector": 1, "vector_full": 1, **{field: 1 for field in STORED_FIELDS}}
+        )
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                staging.add(batch)
+                batch = []
+        staging.add(batch)
+        open(staging.vectors_path, "ab").close()  # exists even if MongoDB holds no vectors
+
+        with self._lock, self._file_lock():
+            os.replace(staging.vectors_path, self.vectors_path)
+            os.replace(staging.log_path, self.log_path)
+            self._load()
+        shutil.rmtree(staging_path, ignore_errors=True)
+        print(f"Local vector store rebuilt with {len(self)} vectors.")
+
+    def _hnsw_add(self, vectors, rows):
+        if self._hnsw.get_max_elements() < self._hnsw.get_current_count() + len(rows):
+            self._hnsw.resize_index(max(2 * self._hnsw.get_max_elements(), self._hnsw.get_current_count() + len(rows)))
+        self._hnsw.add_items(vectors, rows)
+
+    def _ensure_hnsw(self):
+        if self._hnsw is not None or self.index_type != "hnsw":
+            return
+        index = hnswlib.Index(space="ip", dim=self.dimensions)
+        index.init_index(max_elements=max(1024, len(self.rows)), ef_construction=200, M=16)
+        self._hnsw = index
+        if len(self.rows):
+            self._hnsw_add(np.asarray(self.matrix), np.arange(len(self.rows)))
+            for row in np.flatnonzero(~self.alive):
+                self._hnsw.mark_deleted(int(row))
+
+    def vector_search(self, query_vector, limit=5, num_candidates=100, include_explain=False,
+                      rescore_vector=None, coarse_to_fine=None, fields=None):
+        """
+        Top-k cosine search with the same result shape (and `fields` selection)
+        as MongoManager.vector_search.
+        Vectors are kept in float32 and scanned exactly, so `rescore_vector` and
+        `coarse_to_fine` are accepted for interface compatibility but not needed.
+        """
+        start = time.perf_counter()
+        query = to_float32(query_vector)
+        query = query / (np.linalg.norm(query) or 1.0)
+        fields = parse_result_fields(fields)
+
+        with self._lock, span("vector_search"):
+            self._refresh()
+            alive_count = int(self.alive.sum())
+            k = min(limit, alive_count)
+            if k == 0:
+                rows, scores = np.zeros(0, dtype=int), np.zeros(0, dtype=np.float32)
+            elif self.index_type == "hnsw":
+                self._ensure_hnsw()
+                self._hnsw.set_ef(max(num_candidates, k))
+                labels, distances = self._hnsw.knn_query(query, k=k)
+                rows, scores = labels[0], 1.0 - distances[0]
+            else:
+                similarities = self.matrix @ query
+                similarities = np.where(self.alive, similarities, -np.inf)
+                rows = np.argpartition(-similarities, k - 1)[:k]
+                rows = rows[np.argsort(-similarities[rows])]
+                scores = similarities[rows]
+
+            results = []
+            for row, score in zip(rows, scores):
+                chunk = {**self.rows[int(row)], "score": float((1.0 + score) / 2.0)}
+                results.append({field: chunk[field] for field in fields if field in chunk})
+
+        if include_explain:
+            return {
+                "results": results,
+                "explain": {
+                    "backend": "local",
+                    "index": self.index_type,
+                    "vectors": alive_count,
+                    "millisElapsed": round((time.perf_counter() - start) * 1000, 3)
+                }
+            }
+        return results
+
+# Stores up to this many vectors are scanned on the event loop itself
+INLINE_SCAN_ROWS = 2000
+
+class AsyncLocalVectorStore:
+    """Awaitable facade so the local store can stand in for AsyncMongoManager.vector_search."""
+
+    def __init__(self, store: LocalVectorStore):
+        self.store = store
+
+    def to_bson_vector(self, vector, dtype=BinaryVectorDtype.FLOAT32):
+        """Converts a list of floats to BSON Binary vector format."""
+        return Binary.from_vector(vector, dtype)
+
+    async def vector_search(self, query_vector, limit=5, num_candidates=100, include_explain=False,
+                            rescore_vector=None, coarse_to_fine=None, fields=None):
+        # A 2000 x 1536 float32 scan takes about a millisecond, cheaper than the thread
+        # hop; anything bigger would stall the event loop, so it runs in a worker thread
+        if len(self.store) <= INLINE_SCAN_ROWS:
+            return self.store.vector_search(query_vector, limit, num_candidates, include_explain, fields=fields)
+        return await asyncio.to_thread(
+            self.store.vector_search, query_vector, limit, num_candidates, include_explain, fields=fields
+        )
+
+_local_store: Optional[LocalVectorStore] = None
+_local_store_lock = threading.Lock()
+
+def local_vector_search_enabled() -> bool:
+    return os.getenv("VECTOR_SEARCH_BACKEND", "mongo").lower() == "local"
+
+def get_local_vector_store() -> Optional[LocalVectorStore]:
+    """Returns the process-wide LocalVectorStore, or None when the local backend is disabled."""
+    global _local_store
+    if not local_vector_search_enabled():
+        return None
+    if _local_store is None:
+        with _local_store_lock:
+            if _local_store is None:
+                _local_store = LocalVectorStore()
+    return _local_store
@@ -1,19 +1,39 @@
 import os
+import asyncio
+import json
 import shutil
 import tempfile
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
-from app.api.uploader import router as uploader_router
+import time
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Depends, Request
 from app.api.search_api import router as search_router
 from typing import Dict, List, Optional
-from app.database import MongoManager
-from app.embedding import get_embedding
+from app.database import AsyncMongoManager, DEFAULT_RESULT_FIELDS
+from app.dependencies import mongo, async_mongo, get_async_mongo, get_vector_backend
+from app.local_vector_store import get_local_vector_store
+from app.embedding import get_embedding_service, close_embedding_service, embedding_cache_stats
+from app.query_cache import get_query_vector, query_cache
+from app.retrieval import hybrid_search
+from app.context_builder import build_context, format_context, get_token_counter
+from app.answer_cache import answer_cache, semantic_cache_enabled
+from app.rate_limiter import estimate_tokens, get_scheduler, scheduler_stats
+from app.metrics import (
+    finish_request_timings, render_metrics, request_duration, server_timing_header, span, start_request_timings
+)
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# "search" runs a search/RAG-only replica: the uploader (and with it Docling,
+# the chunker and the conversion process pool) is never imported
+APP_MODE = os.getenv("APP_MODE", "all").lower()
+INGESTION_ENABLED = APP_MODE != "search"
+if INGESTION_ENABLED:
+    from app.api.uploader import router as uploader_router, job_queue, shutdown_process_pool, warm_ingestion
+
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 app = FastAPI(title="Docling & RAG API")
 
@@ -26,33 +46,209 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# converter = DocumentConverter()  # Moved to api/uploader.py
-mongo = MongoManager()
-client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+# Responses of these endpoints carry a Server-Timing header with their stage spans
+SERVER_TIMING_PREFIXES = ("/search", "/llm-with-rag")
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """
+    Records the request duration histogram and, for search / RAG endpoints,
+    adds a Server-Timing header with the spans recorded while handling it.
+    Streamed responses only include the spans before the first byte.
+    """
+    token = start_request_timings()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        timings = finish_request_timings(token)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    request_duration.observe(route.path if route is not None else "unmatched", elapsed)
+    if request.url.path.startswith(SERVER_TIMING_PREFIXES):
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
+# converter = DocumentConverter()  # Moved to api/uploader.py (created lazily)
+_client = None
+
+def get_client() -> genai.Client:
+    """Returns the shared Gemini client used for generation, created on first use."""
+    global _client
+    if _client is None:
+        _client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    return _client
+
+async def warmup() -> dict:
+    """
+    Creates the lazily initialized heavy objects ahead of the first request:
+    the Gemini clients, the RAG context tokenizer and, unless running
+    search-only, the chunker tokenizer and the Docling models of the
+    conversion workers. Returns the seconds spent per component.
+    """
+    timings = {}
+    start = time.perf_counter()
+    get_embedding_service()
+    get_client()
+    timings["clients"] = round(time.perf_counter() - start, 3)
+    start = time.perf_counter()
+    await asyncio.to_thread(get_token_counter)
+    timings["context_tokenizer"] = round(time.perf_counter() - start, 3)
+    if INGESTION_ENABLED:
+        timings.update(await asyncio.to_thread(warm_ingestion))
+    return timings
 
 @app.on_event("startup")
 async def startup_db_client():
     if mongo.connect():
         # Ensure indices exist
-        mongo.create_vector_index(dimensions=1536)
+        mongo.ensure_vector_indexes(dimensions=1536)
         mongo.create_text_index()
+        mongo.create_source_index()
+
+        # Seed the local vector engine from MongoDB the first time it is enabled
+        local_store = get_local_vector_store()
+        if local_store is not None and len(local_store) == 0:
+            await asyncio.to_thread(local_store.rebuild_from_mongo, mongo)
     else:
         print("Warning: Could not connect to MongoDB on startup.")
 
+    if not await async_mongo.connect():
+        print("Warning: Could not connect async MongoDB client on startup.")
+
+    if INGESTION_ENABLED:
+        await job_queue.start()
+
+    if os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true":
+        print(f"Warmup finished: {await warmup()}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if INGESTION_ENABLED:
+        await job_queue.stop()
+        shutdown_process_pool()
     mongo.close()
+    await async_mongo.close()
+    close_embedding_service()
     try:
-        client.close()
+        if _client is not None:
+            _client.close()
     except:
         pass
 
 # Include routers
-app.include_router(uploader_router)
+if INGESTION_ENABLED:
+    app.include_router(uploader_router)
 app.include_router(search_router)
 
 
 
+# content_hash lets the semantic answer cache check the chunks are unchanged
+RAG_FIELDS = DEFAULT_RESULT_FIELDS + ("content_hash",)
+
+async def retrieve_context(mongo, vector_backend, query: str, type: str, limit: int):
+    """Retrieves RAG context with the requested search type."""
+    if type == "keyword":
+        return await mongo.keyword_search(query, limit=limit, fields=RAG_FIELDS)
+    elif type == "hybrid":
+        # Keyword and vector retrieval in parallel, fused with RRF
+        return await hybrid_search(mongo, query, limit=limit, vector_backend=vector_backend, fields=RAG_FIELDS)
+    else:
+        # Semantic search
+        raw_vector, bson_vector = await get_query_vector(query, vector_backend)
+        return await vector_backend.vector_search(
+            bson_vector, limit=limit, rescore_vector=raw_vector, fields=RAG_FIELDS
+        )
+
+async def build_rag_prompt(query: str, search_results) -> str:
+    """
+    Formats the retrieved chunks and the question into the LLM prompt. The
+    context is deduplicated, adjacent chunks are merged and it is capped at
+    RAG_CONTEXT_MAX_TOKENS tokens. Tokenizing (and loading the tokenizer on a
+    replica that skipped warmup) runs in a worker thread, off the event loop.
+    """
+    with span("context"):
+        passages = await asyncio.to_thread(build_context, search_results)
+        context_text = format_context(passages)
+    return f"""
+You are a helpful assistant. Use the following context to answer the user's question. 
+If the context doesn't contain the answer, say that you don't know based on the provided information, but try to be as helpful as possible with what is given.
+
+Context:
+{context_text}
+
+Question: {query}
+"""
+
+async def lookup_cached_answer(mongo, vector_backend, query: str, type: str, limit: int):
+    """
+    Looks the query up in the semantic answer cache. Returns the query vector
+    (None when the cache is disabled or the query could not be embedded) and
+    the cached entry, which is only returned while its chunks are still stored.
+
+    Only semantic and hybrid searches consult the cache, since they embed the
+    query anyway (the vector is reused from the query cache for retrieval);
+    keyword requests would otherwise pay an extra embedding round trip. The
+    lookup is opportunistic: no retries, and it gives up after
+    SEMANTIC_CACHE_LOOKUP_TIMEOUT_SECONDS.
+    """
+    if not semantic_cache_enabled() or type == "keyword":
+        return None, None
+    try:
+        raw_vector, _ = await asyncio.wait_for(
+            get_query_vector(query, vector_backend, max_retries=0),
+            timeout=float(os.getenv("SEMANTIC_CACHE_LOOKUP_TIMEOUT_SECONDS", "2"))
+        )
+    except Exception as e:
+        print(f"Semantic answer cache skipped: {e}")
+        return None, None
+
+    entry = answer_cache.lookup(raw_vector, type, limit)
+    if entry is not None and not await mongo.chunks_exist(entry["chunks"]):
+        answer_cache.invalidate(entry)
+        entry = None
+    return raw_vector, entry
+
+GENERATION_CONFIG = types.GenerateContentConfig(temperature=0.7)
+
+async def generate(model: str, contents: str):
+    """Gemini generation through the shared "generation" rate-limit scheduler."""
+    return await get_scheduler("generation").run(
+        lambda: get_client().aio.models.generate_content(
+            model=model, contents=contents, config=GENERATION_CONFIG
+        ),
+        tokens=estimate_tokens(contents)
+    )
+
+def sse_event(event: str, data) -> str:
+    """Formats one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_text(model: str, contents: str):
+    """
+    Yields the text deltas of a streamed Gemini generation. Opening the stream
+    is scheduled and retried; errors after the first token are not retried.
+    """
+    stream = await get_scheduler("generation").run(
+        lambda: get_client().aio.models.generate_content_stream(
+            model=model, contents=contents, config=GENERATION_CONFIG
+        ),
+        tokens=estimate_tokens(contents)
+    )
+    with span("llm_stream"):
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+async def stream_generation(model: str, contents: str):
+    """Yields SSE `token` events from a streamed Gemini generation, then `done`."""
+    async for text in stream_text(model, contents):
+        yield sse_event("token", {"text": text})
+    yield sse_event("done", {})
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 @app.get("/llm")
 async def ask_llm(
     query: str = Query(..., description="The query text for the LLM")
@@ -62,13 +258,8 @@ async def ask_llm(
     """
     try:
         # Use the async client to generate content
-        response = await client.aio.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=query,
-            config=types.GenerateContentConfig(
-                temperature=0.7,
-            )
-        )
+        with span("llm"):
+            response = await generate('gemini-2.5-flash', query)
         
         return {
             "query": query,
@@ -77,68 +268,170 @@ async def ask_llm(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM request failed: {str(e)}")
 
+@app.get("/llm/stream")
+async def ask_llm_stream(
+    query: str = Query(..., description="The query text for the LLM")
+):
+    """
+    Streams the Gemini response as server-sent events: `token` events carrying
+    text deltas, then a final `done` event (or `error`).
+    """
+    async def events():
+        try:
+            async for event in stream_generation('gemini-2.5-flash', query):
+                yield event
+        except Exception as e:
+            yield sse_event("error", {"detail": f"LLM request failed: {str(e)}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.get("/llm-with-rag")
 async def ask_llm_with_rag(
     query: str = Query(..., description="The query text for the RAG and LLM"),
-    type: str = Query("keyword", enum=["keyword", "semantic"], description="Type of search to perform for context"),
-    limit: int = Query(3, ge=1, le=10, description="Number of context documents to retrieve")
+    type: str = Query("keyword", enum=["keyword", "semantic", "hybrid"], description="Type of search to perform for context"),
+    limit: int = Query(3, ge=1, le=10, description="Number of context documents to retrieve"),
+    mongo: AsyncMongoManager = Depends(get_async_mongo),
+    vector_backend = Depends(get_vector_backend)
 ):
     """
     Combines search with Gemini LLM. 
     First retrieves relevant context from MongoDB, then sends it to the LLM.
     Defaults to keyword search as embeddings might have issues.
+    Answers to semantically equivalent questions are served from the semantic
+    answer cache while the chunks they were based on are unchanged.
     """
-    if mongo.db is None:
-        if not mongo.connect():
-            raise HTTPException(status_code=500, detail="Database connection failed")
-
     try:
+        # 0. Serve a cached answer for a near-identical earlier question
+        query_vector, cached = await lookup_cached_answer(mongo, vector_backend, query, type, limit)
+        if cached is not None:
+            return {
+                "query": query,
+                "search_type": type,
+                "results": cached["results"],
+                "llm_response": cached["answer"],
+                "cached": True,
+                "cached_query": cached["query"],
+                "similarity": cached["similarity"]
+            }
+
         # 1. Search for context based on type
-        if type == "keyword":
-            search_results = mongo.keyword_search(query, limit=limit)
-        else:
-            # Semantic search
-            raw_vector = get_embedding(query)
-            bson_vector = mongo.to_bson_vector(raw_vector)
-            search_results = mongo.vector_search(bson_vector, limit=limit)
+        search_results = await retrieve_context(mongo, vector_backend, query, type, limit)
         
-        # 2. Format context for LLM
-        context_text = "\n\n".join([f"Source {i+1}:\n{res.get('text', '')}" for i, res in enumerate(search_results)])
+        # 2. Construct the prompt with context
+        prompt = await build_rag_prompt(query, search_results)
         
-        # 3. Construct the prompt with context
-        prompt = f"""
-You are a helpful assistant. Use the following context to answer the user's question. 
-If the context doesn't contain the answer, say that you don't know based on the provided information, but try to be as helpful as possible with what is given.
-
-Context:
-{context_text}
-
-Question: {query}
-"""
+        # 3. Get response from Gemini
+        with span("llm"):
+            response = await generate('gemini-2.0-flash', prompt)
         
-        # 4. Get response from Gemini
-        response = await client.aio.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.7,
-            )
-        )
-        
-        # 5. Return combined results
+        if query_vector is not None and response.text:
+            answer_cache.store(query_vector, type, limit, query, search_results, response.text)
+
+        # 4. Return combined results
         return {
             "query": query,
             "search_type": type,
             "results": search_results,
-            "llm_response": response.text
+            "llm_response": response.text,
+            "cached": False
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"RAG process failed: {str(e)}")
 
+@app.get("/llm-with-rag/stream")
+async def ask_llm_with_rag_stream(
+    query: str = Query(..., description="The query text for the RAG and LLM"),
+    type: str = Query("keyword", enum=["keyword", "semantic", "hybrid"], description="Type of search to perform for context"),
+    limit: int = Query(3, ge=1, le=10, description="Number of context documents to retrieve"),
+    mongo: AsyncMongoManager = Depends(get_async_mongo),
+    vector_backend = Depends(get_vector_backend)
+):
+    """
+    Streaming variant of /llm-with-rag using server-sent events. Sends the
+    retrieved chunks as a `search_results` event as soon as retrieval finishes,
+    then `token` events as Gemini generates, then `done` (or `error`). A
+    semantic answer cache hit is sent as a single `token` event.
+    """
+    async def events():
+        try:
+            query_vector, cached = await lookup_cached_answer(mongo, vector_backend, query, type, limit)
+            if cached is not None:
+                yield sse_event("search_results", {
+                    "query": query,
+                    "search_type": type,
+                    "results": cached["results"],
+                    "cached": True
+                })
+                yield sse_event("token", {"text": cached["answer"]})
+                yield sse_event("done", {"cached": True, "similarity": cached["similarity"]})
+                return
+
+            search_results = await retrieve_context(mongo, vector_backend, query, type, limit)
+            yield sse_event("search_results", {
+                "query": query,
+                "search_type": type,
+                "results": search_results,
+                "cached": False
+            })
+            answer = []
+            async for text in stream_text('gemini-2.0-flash', await build_rag_prompt(query, search_results)):
+                answer.append(text)
+                yield sse_event("token", {"text": text})
+            if query_vector is not None and answer:
+                answer_cache.store(query_vector, type, limit, query, search_results, "".join(answer))
+            yield sse_event("done", {"cached": False})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"RAG process failed: {str(e)}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/documents/{document_id}")
+async def get_document(
+    document_id: str,
+    mongo: AsyncMongoManager = Depends(get_async_mongo)
+):
+    """
+    Returns the document-level metadata (origin, page count, ...) that search
+    results reference through `document_id`.
+    """
+    try:
+        document = await mongo.get_document(document_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid document id: {str(e)}")
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    document["_id"] = str(document["_id"])
+    return document
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage and request latency histograms in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.post("/warmup")
+async def warmup_endpoint():
+    """
+    Loads the heavy dependencies now instead of on the first request
+    (e.g. from a readiness hook before the replica takes traffic).
+    """
+    try:
+        return {"mode": APP_MODE, "warmed": await warmup()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Warmup failed: {str(e)}")
+
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "db_connected": mongo.db is not None}
+    return {
+        "status": "ok",
+        "mode": APP_MODE,
+        "db_connected": mongo.db is not None,
+        "query_cache": query_cache.stats(),
+        # COUNT(*) over SQLite; keep it off the event loop
+        "embedding_cache": await asyncio.to_thread(embedding_cache_stats),
+        "answer_cache": answer_cache.stats(),
+        "rate_limits": scheduler_stats()
+    }
 
 if __name__ == "__main__":
     import uvicorn
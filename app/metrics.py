@@ -0,0 +1,111 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds in seconds; Docling conversion can take minutes, a cached search microseconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+class Histogram:
+    """
+    Minimal Prometheus histogram with one label. Keeps cumulative bucket
+    counts, sum and count per label value and renders them in the text
+    exposition format.
+    """
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                # bucket counts, sum, count
+                series = self._series[label_value] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[0][i] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for value, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {total}')
+                lines.append(f'{self.name}_count{{{self.label}="{value}"}} {count}')
+        return lines
+
+stage_duration = Histogram(
+    "rag_stage_duration_seconds",
+    "Duration of conversion, ingestion, search and generation stages.",
+    "stage"
+)
+request_duration = Histogram(
+    "rag_request_duration_seconds",
+    "HTTP request duration until the response headers are ready.",
+    "path"
+)
+
+# Spans recorded during the current request, for the Server-Timing header
+_request_timings: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_timings", default=None)
+
+def observe(stage: str, seconds: float):
+    """Records one stage duration in the histogram and the current request's timings."""
+    stage_duration.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+@contextmanager
+def span(stage: str):
+    """Times the enclosed block as `stage` (works in sync and async code)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+def timed_iter(iterable: Iterable, stage: str):
+    """Yields from `iterable`, timing each step of it (e.g. a lazy chunker) as `stage`."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        observe(stage, time.perf_counter() - start)
+        yield item
+
+def start_request_timings() -> contextvars.Token:
+    """Starts collecting spans for the current request."""
+    return _request_timings.set([])
+
+def finish_request_timings(token: contextvars.Token) -> List[Tuple[str, float]]:
+    """Stops collecting and returns the request's spans, summed per stage in first-seen order."""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    totals: Dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return list(totals.items())
+
+def server_timing_header(timings: List[Tuple[str, float]], total_seconds: float) -> str:
+    """Formats spans as a Server-Timing header value (durations in milliseconds)."""
+    entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings]
+    entries.append(f"total;dur={total_seconds * 1000:.2f}")
+    return ", ".join(entries)
+
+def render_metrics() -> str:
+    """All histograms in the Prometheus text exposition format."""
+    return "\n".join(stage_duration.render() + request_duration.render()) + "\n"
@@ -0,0 +1,284 @@
+import os
+import queue
+import threading
+import time
+from bson.binary import BinaryVectorDtype
+from typing import Callable, Optional
+from scripts.chunking import chunk_document, get_contextualized_text, get_content_hash
+from app.embedding import get_embedding
+from app.database import MongoManager, matryoshka_dimensions, truncate_vector
+from app.local_vector_store import get_local_vector_store
+from app.metrics import span, timed_iter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Marks the end of a stage's input
+_DONE = object()
+
+def sanitize_metadata(d):
+    """Helper to sanitize dict values for MongoDB"""
+    if isinstance(d, dict):
+        return {k: sanitize_metadata(v) for k, v in d.items()}
+    elif isinstance(d, list):
+        return [sanitize_metadata(v) for v in d]
+    elif isinstance(d, int):
+        # MongoDB 8 supports Int64, but if it exceeds that, cast to string
+        if d > 9223372036854775807 or d < -9223372036854775808:
+            return str(d)
+        return d
+    return d
+
+def document_fields(doc) -> dict:
+    """Document-level metadata stored once per source in the `documents` collection."""
+    return sanitize_metadata({
+        "name": doc.name,
+        "origin": doc.origin.model_dump() if doc.origin else None,
+        "num_pages": doc.num_pages(),
+        "schema_name": doc.schema_name,
+        "version": doc.version
+    })
+
+def chunk_fields(chunk) -> dict:
+    """
+    Slim per-chunk metadata: the pages the chunk spans, its heading trail and
+    captions. Provenance details (doc_items, bounding boxes) are not stored.
+    """
+    pages = sorted({prov.page_no for item in chunk.meta.doc_items for prov in item.prov})
+    return {
+        "page": pages[0] if pages else None,
+        "pages": pages,
+        "headings": chunk.meta.headings or [],
+        "captions": getattr(chunk.meta, "captions", None) or []
+    }
+
+class StageStats:
+    """Item counter and busy time of one pipeline stage."""
+
+    def __init__(self):
+        self.items = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.seconds += seconds
+
+    def to_dict(self):
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.seconds, 3),
+            "items_per_second": round(self.items / self.seconds, 2) if self.seconds else None
+        }
+
+class IngestionPipeline:
+    """
+    Streaming chunk -> embed -> insert pipeline for one document.
+
+    Chunks flow out of HybridChunker.chunk one at a time, are hashed and diffed
+    against what is already stored for the source, and only new chunks are
+    grouped into embedding batches. Batches go through a bounded queue to a pool
+    of embedding threads, and embedded documents through a second bounded queue
+    to a bulk-insert thread. The bounded queues apply backpressure, so embedding
+    and Mongo writes overlap while memory stays flat regardless of document size.
+    """
+
+    def __init__(
+        self,
+        mongo: MongoManager,
+        source: str,
+        embed_batch_size: Optional[int] = None,
+        embed_workers: Optional[int] = None,
+        insert_batch_size: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        progress: Optional[Callable] = None
+    ):
+        self.mongo = mongo
+        self.source = source
+        self.embed_batch_size = embed_batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", "50"))
+        self.embed_workers = embed_workers or int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+        self.insert_batch_size = insert_batch_size or int(os.getenv("MONGO_INSERT_BATCH_SIZE", "500"))
+        queue_size = queue_size or int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+        self.progress = progress or (lambda stage, **fields: None)
+
+        self.embed_queue = queue.Queue(maxsize=queue_size)
+        self.insert_queue = queue.Queue(maxsize=queue_size)
+        self.stats = {name: StageStats() for name in ("chunk", "embed", "insert")}
+        self.summary = {"inserted": 0, "failed": 0, "errors": []}
+        self.errors = []
+        self.unchanged = 0
+        self.local_store = get_local_vector_store()
+        self.small_dimensions = matryoshka_dimensions()
+        self._stop = threading.Event()
+
+    def _put(self, q, item):
+        # Blocks while the queue is full, but gives up if another stage failed
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fail(self, stage, error):
+        print(f"Pipeline {stage} stage failed: {error}")
+        self.errors.append(f"{stage}: {error}")
+        self._stop.set()
+
+    def _embed_worker(self):
+        while True:
+            batch = self.embed_queue.get()
+            if batch is _DONE:
+                return
+            if self._stop.is_set():
+                continue
+            try:
+                start = time.perf_counter()
+                with span("embed"):
+                    vectors = get_embedding([item.pop("enriched_text") for item in batch])
+                for item, raw_vector in zip(batch, vectors):
+                    item["vector"] = self.mongo.to_bson_vector(raw_vector)
+                    if self.mongo.vector_dtype != BinaryVectorDtype.FLOAT32:
+                        # Full-precision copy for rescoring quantized search candidates
+                        item["vector_full"] = self.mongo.to_bson_vector(raw_vector, BinaryVectorDtype.FLOAT32)
+                    if self.small_dimensions:
+                        # Truncated Matryoshka vector for coarse-to-fine retrieval
+                        item["vector_small"] = truncate_vector(raw_vector, self.small_dimensions)
+                self.stats["embed"].add(len(batch), time.perf_counter() - start)
+                # Not _put: embedded chunks are inserted even after another stage failed,
+                # so a retry of the document doesn't pay for their embeddings again
+                self.insert_queue.put(batch)
+            except Exception as e:
+                self._fail("embed", e)
+
+    def _insert_worker(self):
+        pending = []
+        failed = False
+
+        def flush():
+            start = time.perf_counter()
+            with span("insert"):
+                summary = self.mongo.insert_chunks(pending)
+            if self.local_store is not None:
+                # Mirror exactly what reached MongoDB: those chunks count as unchanged on a retry
+                failed_ids = set(summary["failed_ids"])
+                written = [doc for doc in pending if doc["_id"] not in failed_ids]
+                if written:
+                    self.local_store.add(written)
+            self.stats["insert"].add(summary["inserted"], time.perf_counter() - start)
+            self.summary["inserted"] += summary["inserted"]
+            self.summary["failed"] += summary["failed"]
+            self.summary["errors"].extend(summary["errors"])
+            self.progress("indexing", chunks_indexed=self.unchanged + self.summary["inserted"])
+            pending.clear()
+
+        while True:
+            batch = self.insert_queue.get()
+            if batch is _DONE:
+                break
+            if failed:
+                continue
+            pending.extend(batch)
+            if len(pending) >= self.insert_batch_size:
+                try:
+                    flush()
+                except Exception as e:
+                    self._fail("insert", e)
+                    failed = True
+                    pending.clear()
+        if pending and not failed:
+            try:
+                flush()
+            except Exception as e:
+                self._fail("insert", e)
+
+    def run(self, doc, chunker) -> dict:
+        """
+        Streams the document through the pipeline. Returns a result dict with
+        chunk counts, the insert summary, per-stage throughput and any errors.
+        Stale chunks are only removed when every stage succeeded.
+        """
+        existing = self.mongo.get_source_chunk_hashes(self.source)
+        document_id = self.mongo.upsert_document(self.source, document_fields(doc))
+        reindex = []
+        self.unchanged = 0
+
+        embed_threads = [threading.Thread(target=self._embed_worker, daemon=True) for _ in range(self.embed_workers)]
+        insert_thread = threading.Thread(target=self._insert_worker, daemon=True)
+        for t in embed_threads + [insert_thread]:
+            t.start()
+
+        self.progress("indexing")
+        batch = []
+        total = 0
+        try:
+            start = time.perf_counter()
+            for i, chunk in enumerate(timed_iter(chunk_document(doc, chunker), "chunk")):
+                if self._stop.is_set():
+                    break
+                total += 1
+                with span("contextualize"):
+                    enriched_text = get_contextualized_text(chunk, chunker)
+                content_hash = get_content_hash(enriched_text)
+
+                matches = existing.get(content_hash)
+                if matches:
+                    # Unchanged chunk: keep the stored copy, only fix its position
+                    stored = matches.pop()
+                    self.unchanged += 1
+                    if stored.get("chunk_index") != i:
+                        reindex.append((stored["_id"], i))
+                else:
+                    batch.append({
+                        "text": chunk.text,
+                        "enriched_text": enriched_text,  # embedded, not stored
+                        "content_hash": content_hash,
+                        "source": self.source,
+                        "document_id": document_id,
+                        "chunk_index": i,
+                        **chunk_fields(chunk)
+                    })
+                    if len(batch) >= self.embed_batch_size:
+                        self.stats["chunk"].add(len(batch), time.perf_counter() - start)
+                        if not self._put(self.embed_queue, batch):
+                            break
+                        batch = []
+                        start = time.perf_counter()
+
+            if batch and not self._stop.is_set():
+                self.stats["chunk"].add(len(batch), time.perf_counter() - start)
+                self._put(self.embed_queue, batch)
+        except Exception as e:
+            self._fail("chunk", e)
+        finally:
+            # Workers always drain to the sentinel, so these puts cannot block forever
+            for _ in embed_threads:
+                self.embed_queue.put(_DONE)
+            for t in embed_threads:
+                t.join()
+            self.insert_queue.put(_DONE)
+            insert_thread.join()
+
+        stale = [stored["_id"] for docs in existing.values() for stored in docs]
+        if not self.errors and not self.summary["failed"]:
+            plan = {"new": [], "reindex": reindex, "stale": stale}
+            self.mongo.apply_source_diff(plan)
+            self.mongo.upsert_document(self.source, {"chunk_count": total})
+            if self.local_store is not None:
+                self.local_store.apply_source_diff(plan)
+        elif stale or reindex:
+            # Keep the previous version's chunks around until a re-upload succeeds
+            print(f"Skipping removal of {len(stale)} stale chunks because indexing did not complete.")
+
+        return {
+            "chunks_total": total,
+            "unchanged": self.unchanged,
+            "inserted": self.summary["inserted"],
+            "failed": self.summary["failed"],
+            "stale_removed": 0 if self.errors or self.summary["failed"] else len(stale),
+            "insert_errors": self.summary["errors"],
+            "errors": self.errors,
+            "stages": {name: stage.to_dict() for name, stage in self.stats.items()}
+        }
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from bson.binary import Binary
+from dotenv import load_dotenv
+from app.embedding import get_embedding_service
+from app.metrics import span
+
+load_dotenv()
+
+class QueryEmbeddingCache:
+    """
+    In-process LRU cache of query text -> (float32 vector, BSON Binary vector),
+    with a per-entry TTL. Shared by the search router and the RAG endpoint so
+    repeated queries skip the embedding round trip.
+    """
+
+    def __init__(self, capacity: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.capacity = capacity or int(os.getenv("QUERY_CACHE_CAPACITY", "1024"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(query: str) -> str:
+        return query.strip()
+
+    def get(self, query: str) -> Optional[Tuple[List[float], Binary]]:
+        """Returns the cached (raw_vector, bson_vector) for the query, or None."""
+        key = self._key(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, query: str, raw_vector: List[float], bson_vector: Binary):
+        """Stores the vectors for the query, evicting the least recently used entry if full."""
+        key = self._key(query)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, (raw_vector, bson_vector))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the hit ratio."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "capacity": self.capacity
+            }
+
+query_cache = QueryEmbeddingCache()
+
+async def get_query_vector(query: str, mongo, max_retries: Optional[int] = None) -> Tuple[List[float], Binary]:
+    """
+    Returns (raw_vector, bson_vector) for a search query, embedding it only on a
+    cache miss. `mongo` is the MongoManager used to build the BSON vector;
+    `max_retries` is passed to the embedding call.
+    """
+    cached = query_cache.get(query)
+    if cached is not None:
+        return cached
+
+    with span("query_embed"):
+        raw_vector = await get_embedding_service().embed(query, max_retries=max_retries)
+    bson_vector = mongo.to_bson_vector(raw_vector)
+    query_cache.put(query, raw_vector, bson_vector)
+    return raw_vector, bson_vector
+
+async def get_query_vectors(queries: List[str], mongo) -> List[Tuple[List[float], Binary]]:
+    """
+    Batch variant of get_query_vector: all cache misses are embedded with a
+    single embedding request. Returns (raw_vector, bson_vector) per query.
+    """
+    vectors = {}
+    missing = []
+    for query in dict.fromkeys(queries):
+        cached = query_cache.get(query)
+        if cached is not None:
+            vectors[query] = cached
+        else:
+            missing.append(query)
+
+    if missing:
+        with span("query_embed"):
+            raw_vectors = await get_embedding_service().embed(missing)
+        for query, raw_vector in zip(missing, raw_vectors):
+            bson_vector = mongo.to_bson_vector(raw_vector)
+            query_cache.put(query, raw_vector, bson_vector)
+            vectors[query] = (raw_vector, bson_vector)
+
+    return [vectors[query] for query in queries]
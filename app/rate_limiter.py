@@ -0,0 +1,245 @@
+import os
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, Tuple, TypeVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+T = TypeVar("T")
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# HTTP status codes worth retrying; 429 additionally shrinks the concurrency limit
+THROTTLED_CODES = {429}
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+def estimate_tokens(contents) -> int:
+    """Rough token count of a prompt or list of texts (~4 characters per token)."""
+    if isinstance(contents, str):
+        return max(1, len(contents) // 4)
+    return sum(estimate_tokens(item) for item in contents)
+
+def classify_error(error: Exception) -> Tuple[bool, bool]:
+    """Returns (retryable, throttled) for an exception raised by a Gemini call."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    text = str(error)
+    throttled = code in THROTTLED_CODES or "RESOURCE_EXHAUSTED" in text
+    retryable = throttled or code in RETRYABLE_CODES or isinstance(error, (TimeoutError, ConnectionError))
+    return retryable, throttled
+
+class RateLimitScheduler:
+    """
+    Shared admission control and retry policy for one class of Gemini calls.
+
+    Calls are admitted while the requests-per-minute and tokens-per-minute
+    budgets of the last 60 seconds and the current concurrency limit allow it.
+    The concurrency limit adapts AIMD-style: it grows by 1/limit on every
+    success and halves on a throttling error (at most once per second).
+    Failed calls with retryable errors are retried with full-jitter
+    exponential backoff.
+
+    Interactive calls (query embeddings, RAG answers) go first: bulk calls
+    wait while an interactive call is waiting, and bulk traffic may only use
+    `1 - interactive_reserve` of each per-minute budget.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rpm: int = 0,
+        tpm: int = 0,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        interactive_reserve: Optional[float] = None
+    ):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency or int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("GEMINI_MAX_RETRIES", "6"))
+        self.backoff_base = backoff_base or float(os.getenv("GEMINI_BACKOFF_BASE_SECONDS", "1"))
+        self.backoff_max = backoff_max or float(os.getenv("GEMINI_BACKOFF_MAX_SECONDS", "60"))
+        self.interactive_reserve = (
+            interactive_reserve if interactive_reserve is not None
+            else float(os.getenv("GEMINI_INTERACTIVE_RESERVE", "0.2"))
+        )
+
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.interactive_waiting = 0
+        self.window = deque()   # (timestamp, tokens) of calls admitted in the last minute
+        self.window_tokens = 0
+        self.counters = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0}
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _budget(self, total: int, priority: str) -> float:
+        if priority == BULK:
+            return total * (1 - self.interactive_reserve)
+        return total
+
+    def _try_admit(self, priority: str, tokens: int) -> float:
+        """Admits the call and returns 0, or returns how long to wait before retrying. Holds _cond."""
+        now = time.monotonic()
+        while self.window and now - self.window[0][0] >= 60:
+            self.window_tokens -= self.window.popleft()[1]
+
+        if priority == BULK and self.interactive_waiting:
+            return 0.01
+        if self.in_flight >= max(1, int(self.limit)):
+            return 0.01
+
+        next_slot = self.window[0][0] + 60 - now if self.window else 0.0
+        if self.rpm and len(self.window) >= self._budget(self.rpm, priority):
+            return max(next_slot, 0.01)
+        # A single call larger than the whole budget is still admitted once the window is empty
+        if self.tpm and self.window and self.window_tokens + tokens > self._budget(self.tpm, priority):
+            return max(next_slot, 0.01)
+
+        self.window.append((now, tokens))
+        self.window_tokens += tokens
+        self.in_flight += 1
+        self.counters["calls"] += 1
+        return 0.0
+
+    def _release(self, outcome: str):
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == "ok":
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            elif outcome == "throttled":
+                self.counters["throttled"] += 1
+                now = time.monotonic()
+                # Many in-flight calls fail together on a 429; back off once per burst
+                if now - self._last_decrease > 1.0:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = now
+            self._cond.notify_all()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _acquire_sync(self, priority: str, tokens: int):
+        with self._cond:
+            if priority == INTERACTIVE:
+                self.interactive_waiting += 1
+            try:
+                while True:
+                    wait = self._try_admit(priority, tokens)
+                    if not wait:
+                        return
+                    self._cond.wait(timeout=wait)
+            finally:
+                if priority == INTERACTIVE:
+                    self.interactive_waiting -= 1
+
+    async def _acquire(self, priority: str, tokens: int):
+        with self._cond:
+            if priority == INTERACTIVE:
+                self.interactive_waiting += 1
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_admit(priority, tokens)
+                if not wait:
+                    return
+                await asyncio.sleep(min(wait, 0.25))
+        finally:
+            if priority == INTERACTIVE:
+                with self._cond:
+                    self.interactive_waiting -= 1
+
+    def _handle_failure(self, error: Exception, attempt: int, max_retries: Optional[int] = None) -> float:
+        """Releases the slot of a failed call; returns the backoff delay, or re-raises."""
+        retryable, throttled = classify_error(error)
+        self._release("throttled" if throttled else "error")
+        if max_retries is None:
+            max_retries = self.max_retries
+        if not retryable or attempt >= max_retries:
+            with self._cond:
+                self.counters["failed"] += 1
+            raise error
+        with self._cond:
+            self.counters["retries"] += 1
+        delay = self._backoff(attempt)
+        print(f"{self.name}: {'throttled' if throttled else 'transient error'} ({error}), retry {attempt + 1} in {delay:.1f}s")
+        return delay
+
+    def run_sync(self, fn: Callable[[], T], priority: str = BULK, tokens: int = 0) -> T:
+        """Runs a blocking call under the budgets, retrying retryable errors."""
+        attempt = 0
+        while True:
+            self._acquire_sync(priority, tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                time.sleep(self._handle_failure(e, attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (e.g. client disconnected): free the slot without counting an outcome
+                self._release("cancelled")
+                raise
+            self._release("ok")
+            return result
+
+    async def run(self, fn: Callable[[], Awaitable[T]], priority: str = INTERACTIVE, tokens: int = 0,
+                  max_retries: Optional[int] = None) -> T:
+        """
+        Awaits a call under the budgets, retrying retryable errors. `max_retries`
+        overrides GEMINI_MAX_RETRIES, e.g. 0 for opportunistic calls.
+        """
+        attempt = 0
+        while True:
+            await self._acquire(priority, tokens)
+            try:
+                result = await fn()
+            except Exception as e:
+                await asyncio.sleep(self._handle_failure(e, attempt, max_retries))
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (e.g. client disconnected): free the slot without counting an outcome
+                self._release("cancelled")
+                raise
+            self._release("ok")
+            return result
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "requests_last_minute": len(self.window),
+                "tokens_last_minute": self.window_tokens,
+                **self.counters
+            }
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(kind: str) -> RateLimitScheduler:
+    """
+    Returns the process-wide scheduler for "embedding" or "generation" calls,
+    configured from GEMINI_<EMBED|GENERATE>_RPM / _TPM (0 = unlimited).
+    """
+    if kind not in _schedulers:
+        with _schedulers_lock:
+            if kind not in _schedulers:
+                prefix = "GEMINI_EMBED" if kind == "embedding" else "GEMINI_GENERATE"
+                _schedulers[kind] = RateLimitScheduler(
+                    kind,
+                    rpm=int(os.getenv(f"{prefix}_RPM", "0")),
+                    tpm=int(os.getenv(f"{prefix}_TPM", "0"))
+                )
+    return _schedulers[kind]
+
+def scheduler_stats() -> dict:
+    return {kind: scheduler.stats() for kind, scheduler in _schedulers.items()}
@@ -0,0 +1,84 @@
+import asyncio
+from typing import Dict, List, Optional
+from app.database import parse_result_fields
+from app.query_cache import get_query_vector
+
+def reciprocal_rank_fusion(
+    result_lists: Dict[str, List[dict]],
+    weights: Optional[Dict[str, float]] = None,
+    k: int = 60,
+    limit: int = 5
+) -> List[dict]:
+    """
+    Fuses ranked result lists with (weighted) reciprocal rank fusion.
+
+    Each hit contributes weight / (k + rank) to its chunk's fused score, with
+    chunks identified by (source, chunk_index) so the same chunk retrieved by
+    several methods is merged. The fused score replaces `score`, and the
+    original per-method ranks are kept as `<name>_rank`.
+    """
+    weights = weights or {}
+    fused = {}
+    for name, results in result_lists.items():
+        weight = weights.get(name, 1.0)
+        for rank, hit in enumerate(results, start=1):
+            key = (hit.get("source"), hit.get("chunk_index"))
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {**hit, "score": 0.0}
+            entry["score"] += weight / (k + rank)
+            entry[f"{name}_rank"] = rank
+
+    return sorted(fused.values(), key=lambda hit: hit["score"], reverse=True)[:limit]
+
+async def hybrid_search(
+    mongo,
+    query: str,
+    limit: int = 5,
+    k: int = 60,
+    keyword_weight: float = 1.0,
+    vector_weight: float = 1.0,
+    num_candidates: int = 100,
+    vector_backend=None,
+    fields=None
+) -> List[dict]:
+    """
+    Runs keyword ($text) and vector retrieval concurrently on the async
+    MongoManager and fuses them with reciprocal rank fusion. If one retrieval
+    fails, the other one's results are still returned. `vector_backend`
+    overrides the engine used for vector retrieval (defaults to `mongo`).
+    `source` and `chunk_index` are always returned since fusion keys on them.
+    """
+    vector_backend = vector_backend or mongo
+    fields = tuple(dict.fromkeys(parse_result_fields(fields) + ("source", "chunk_index")))
+    # Retrieve deeper than `limit` so fusion has something to re-rank
+    depth = max(limit * 2, 10)
+
+    async def vector_results():
+        raw_vector, bson_vector = await get_query_vector(query, vector_backend)
+        return await vector_backend.vector_search(
+            bson_vector, limit=depth, num_candidates=max(num_candidates, depth), rescore_vector=raw_vector,
+            fields=fields
+        )
+
+    keyword, vector = await asyncio.gather(
+        mongo.keyword_search(query, limit=depth, fields=fields),
+        vector_results(),
+        return_exceptions=True
+    )
+
+    result_lists = {}
+    for name, results in (("keyword", keyword), ("vector", vector)):
+        if isinstance(results, Exception):
+            print(f"Hybrid search: {name} retrieval failed: {results}")
+        else:
+            result_lists[name] = results
+    if not result_lists:
+        raise keyword
+
+    return reciprocal_rank_fusion(
+        result_lists,
+        weights={"keyword": keyword_weight, "vector": vector_weight},
+        k=k,
+        limit=limit
+    )
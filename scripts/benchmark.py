@@ -0,0 +1,310 @@
+"""
+Offline benchmark for ingestion and search.
+
+Runs entirely in-process without MongoDB or the Gemini API: embeddings come
+from the deterministic fake backend (EMBEDDING_BACKEND=fake), vector search
+from the local vector engine, and the remaining MongoManager calls from the
+in-memory stand-in below. Measures:
+
+  - chunks/sec through save_vector_chunks (first upload and unchanged re-upload)
+  - p50/p95/p99 latency and throughput of each /search/* endpoint
+  - p50/p95/p99 latency of the /llm-with-rag retrieval step per search type
+
+Results are written as JSON; --compare checks them against an earlier run
+(e.g. from the base commit) and exits with status 1 on regressions.
+
+Usage:
+    uv run scripts/benchmark.py --output bench.json
+    uv run scripts/benchmark.py --compare bench.json --output bench-new.json
+"""
+import os
+import sys
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+# Add project root to sys.path to allow imports from app/ and scripts/
+root_dir = Path(__file__).resolve().parent.parent
+if str(root_dir) not in sys.path:
+    sys.path.append(str(root_dir))
+
+WORDS = (
+    "walmart relocation store employee benefit policy moving expense housing allowance "
+    "manager transfer region distribution center schedule payroll training safety "
+    "inventory supplier contract review approval deadline budget travel family support"
+).split()
+
+def configure_environment(args):
+    """Points the app at the offline backends. Must run before importing app modules."""
+    os.environ["EMBEDDING_BACKEND"] = "fake"
+    os.environ["FAKE_EMBEDDING_LATENCY_MS"] = str(args.embed_latency_ms)
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+    os.environ["VECTOR_SEARCH_BACKEND"] = "local"
+    os.environ["LOCAL_VECTOR_STORE_PATH"] = tempfile.mkdtemp(prefix="bench-vectors-")
+    os.environ["LOCAL_VECTOR_INDEX"] = args.index
+
+class InMemoryMongo:
+    """
+    Stand-in for MongoManager / AsyncMongoManager with the calls used by the
+    ingestion pipeline and the search endpoints. Chunks live in a dict, keyword
+    search is a term-frequency scan; vector search goes to the local engine.
+    """
+
+    def __init__(self):
+        from app.database import vector_storage_dtype
+        self.vector_dtype = vector_storage_dtype()
+        self.coarse_to_fine = False
+        self.chunks = {}
+        self.documents = {}
+        self._next_id = 0
+
+    def connect(self, db_name=None, collection_name="vectorData"):
+        return True
+
+    def close(self):
+        pass
+
+    def to_bson_vector(self, vector, dtype=None):
+        from app.database import quantize_vector
+        return quantize_vector(vector, dtype or self.vector_dtype)
+
+    def ensure_vector_indexes(self, dimensions=1536):
+        pass
+
+    def upsert_document(self, source, fields):
+        self.documents.setdefault(source, {"_id": len(self.documents)}).update(fields)
+        return self.documents[source]["_id"]
+
+    def get_source_chunk_hashes(self, source):
+        existing = defaultdict(list)
+        for _id, doc in self.chunks.items():
+            if doc["source"] == source:
+                existing[doc["content_hash"]].append({"_id": _id, "chunk_index": doc["chunk_index"]})
+        return existing
+
+    def insert_chunks(self, documents, batch_size=None, max_retries=None):
+        for doc in documents:
+            doc.setdefault("_id", self._next_id)
+            self._next_id += 1
+            self.chunks[doc["_id"]] = doc
+        return {"inserted": len(documents), "failed": 0, "failed_ids": [], "errors": []}
+
+    def apply_source_diff(self, plan):
+        for _id, index in plan["reindex"]:
+            self.chunks[_id]["chunk_index"] = index
+        for _id in plan["stale"]:
+            self.chunks.pop(_id, None)
+
+    async def keyword_search(self, query_text, limit=5, fields=None):
+        from app.database import parse_result_fields
+        terms = query_text.lower().split()
+        scored = []
+        for doc in self.chunks.values():
+            words = doc["text"].lower().split()
+            score = sum(words.count(term) for term in terms) / (len(words) or 1)
+            if score:
+                scored.append({**doc, "score": score})
+        scored.sort(key=lambda hit: hit["score"], reverse=True)
+        fields = parse_result_fields(fields)
+        return [{field: hit[field] for field in fields if field in hit} for hit in scored[:limit]]
+
+    async def atlas_search(self, query_text, limit=5, fields=None):
+        return await self.keyword_search(query_text, limit, fields)
+
+    async def chunks_exist(self, chunks):
+        return True
+
+def synthetic_document(sections, paragraphs, seed=0):
+    """Builds a deterministic DoclingDocument of headed sections of random prose."""
+    from docling_core.types.doc import DocItemLabel, DoclingDocument
+    rng = random.Random(seed)
+    doc = DoclingDocument(name="benchmark")
+    for section in range(sections):
+        doc.add_heading(text=f"Section {section}: {' '.join(rng.sample(WORDS, 3))}", level=1)
+        for _ in range(paragraphs):
+            doc.add_text(label=DocItemLabel.TEXT, text=" ".join(rng.choice(WORDS) for _ in range(120)))
+    return doc
+
+def summarize(latencies, errors, wall_seconds):
+    """Latency percentiles (nearest rank, in ms) and throughput of one scenario."""
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        if not ordered:
+            return None
+        return round(ordered[max(math.ceil(p / 100 * len(ordered)), 1) - 1] * 1000, 3)
+
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else None,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else None
+    }
+
+async def run_load(call, requests, concurrency):
+    """Issues `requests` calls from `concurrency` concurrent workers and summarizes them."""
+    latencies = []
+    errors = 0
+
+    async def worker(offset):
+        nonlocal errors
+        for i in range(offset, requests, concurrency):
+            start = time.perf_counter()
+            try:
+                await call(i)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors += 1
+                if errors == 1:
+                    print(f"  first error: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+def benchmark_ingestion(mongo, args):
+    from app.api.uploader import save_vector_chunks
+
+    doc = synthetic_document(args.sections, args.paragraphs, args.seed)
+    results = {}
+    for run in ("initial", "unchanged_reupload"):
+        start = time.perf_counter()
+        chunks = save_vector_chunks(doc, "benchmark.pdf", mongo)
+        seconds = time.perf_counter() - start
+        results[run] = {
+            "chunks": chunks,
+            "seconds": round(seconds, 3),
+            "chunks_per_second": round(chunks / seconds, 2) if seconds else None
+        }
+        print(f"Ingestion ({run}): {chunks} chunks in {seconds:.2f}s")
+    return results
+
+async def benchmark_search(mongo, args):
+    import httpx
+    from app.dependencies import get_async_mongo, get_vector_backend
+    from app.local_vector_store import AsyncLocalVectorStore, get_local_vector_store
+    from app.main import app, retrieve_context
+    from app.query_cache import query_cache
+
+    vector_backend = AsyncLocalVectorStore(get_local_vector_store())
+    app.dependency_overrides[get_async_mongo] = lambda: mongo
+    app.dependency_overrides[get_vector_backend] = lambda: vector_backend
+
+    rng = random.Random(args.seed)
+    queries = [" ".join(rng.sample(WORDS, 3)) for _ in range(args.distinct_queries)]
+
+    results = {"search": {}, "rag_retrieval": {}}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as http:
+        for endpoint in ("text", "atlas", "vector", "hybrid"):
+            query_cache.clear()
+
+            async def call(i, endpoint=endpoint):
+                response = await http.get(f"/search/{endpoint}", params={"query": queries[i % len(queries)], "limit": 5})
+                response.raise_for_status()
+
+            results["search"][endpoint] = await run_load(call, args.requests, args.concurrency)
+            print(f"/search/{endpoint}: {results['search'][endpoint]}")
+
+    for search_type in ("keyword", "semantic", "hybrid"):
+        query_cache.clear()
+
+        async def call(i, search_type=search_type):
+            await retrieve_context(mongo, vector_backend, queries[i % len(queries)], search_type, 3)
+
+        results["rag_retrieval"][search_type] = await run_load(call, args.requests, args.concurrency)
+        print(f"/llm-with-rag retrieval ({search_type}): {results['rag_retrieval'][search_type]}")
+
+    app.dependency_overrides.clear()
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=root_dir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def compare(baseline, current, threshold):
+    """
+    Prints per-scenario changes against a baseline run and returns the list of
+    regressions (p95 latency up or throughput down by more than `threshold` %).
+    """
+    regressions = []
+
+    def check(name, metric, old, new, higher_is_better):
+        if not old or new is None:
+            return
+        change = (new - old) / old * 100
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        print(f"{name:<32} {metric:<18} {old:>12} -> {new:<12} ({change:+.1f}%){flag}")
+        if flag:
+            regressions.append(f"{name} {metric}")
+
+    for run, stats in current.get("ingestion", {}).items():
+        old = baseline.get("ingestion", {}).get(run, {})
+        check(f"ingestion/{run}", "chunks_per_second", old.get("chunks_per_second"), stats["chunks_per_second"], True)
+    for group in ("search", "rag_retrieval"):
+        for name, stats in current.get(group, {}).items():
+            old = baseline.get(group, {}).get(name, {})
+            check(f"{group}/{name}", "p95_ms", old.get("p95_ms"), stats["p95_ms"], False)
+            check(f"{group}/{name}", "throughput_rps", old.get("throughput_rps"), stats["throughput_rps"], True)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion and search benchmark")
+    parser.add_argument("--sections", type=int, default=40, help="Sections in the synthetic document")
+    parser.add_argument("--paragraphs", type=int, default=25, help="Paragraphs per section")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per search scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients per scenario")
+    parser.add_argument("--distinct-queries", type=int, default=100, help="Size of the query pool")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Simulated embedding API latency")
+    parser.add_argument("--index", choices=["flat", "hnsw"], default="flat", help="Local vector index")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    mongo = InMemoryMongo()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "ingestion": benchmark_ingestion(mongo, args),
+        **asyncio.run(benchmark_search(mongo, args))
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nComparing against {args.compare} (commit {baseline.get('commit')})")
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions above {args.threshold}%")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
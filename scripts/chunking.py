@@ -1,14 +1,18 @@
+import hashlib
+from functools import lru_cache
 from typing import Iterator
 from docling.chunking import HybridChunker
 from docling_core.types.doc import DoclingDocument
 from docling_core.transforms.chunker.base import BaseChunk
 
+@lru_cache(maxsize=None)
 def get_docling_chunker(tokenizer_model: str = "sentence-transformers/all-MiniLM-L6-v2") -> HybridChunker:
     """
     Returns a configured HybridChunker instance.
     
     The HybridChunker balances document structure (headings, lists, etc.) 
-    with token limits of the embedding model.
+    with token limits of the embedding model. Instances are cached per
+    tokenizer model, so the tokenizer is loaded once per process.
     
     Args:
         tokenizer_model (str): The name of the transformer model to use for tokenization.
@@ -40,6 +44,15 @@ def get_contextualized_text(chunk: BaseChunk, chunker: HybridChunker) -> str:
     """
     return chunker.contextualize(chunk=chunk)
 
+def get_content_hash(enriched_text: str) -> str:
+    """
+    Returns the SHA-256 content hash stored with each chunk.
+    
+    Hashing the contextualized text means a chunk is considered changed when
+    either its text or its heading context changes.
+    """
+    return hashlib.sha256(enriched_text.encode("utf-8")).hexdigest()
+
 if __name__ == "__main__":
     # Example usage (dry run)
     print("Docling Chunking Utility Loaded.")
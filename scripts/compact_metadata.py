@@ -0,0 +1,37 @@
+import sys
+from pathlib import Path
+
+# Add project root to sys.path to allow imports from app/ and scripts/
+root_dir = Path(__file__).resolve().parent.parent
+if str(root_dir) not in sys.path:
+    sys.path.append(str(root_dir))
+
+from app.database import MongoManager
+from app.local_vector_store import get_local_vector_store
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def compact_metadata():
+    """
+    One-off migration of chunks indexed with the full Docling metadata to the
+    slim chunk schema plus the `documents` collection.
+    """
+    mongo = MongoManager()
+    if not mongo.connect():
+        print("Failed to connect to MongoDB. Exiting.")
+        return
+
+    try:
+        migrated = mongo.compact_chunk_metadata()
+        print(f"Migrated {migrated} chunks to the slim schema.")
+
+        # The local engine keeps its own copy of the chunk fields
+        local_store = get_local_vector_store()
+        if migrated and local_store is not None:
+            local_store.rebuild_from_mongo(mongo)
+    finally:
+        mongo.close()
+
+if __name__ == "__main__":
+    compact_metadata()
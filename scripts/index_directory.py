@@ -0,0 +1,190 @@
+"""
+Bulk-indexes every supported document under a directory.
+
+Documents are converted in parallel by a process pool (one Docling converter
+per core) while the main process feeds the converted documents through the
+shared ingestion pipeline, so one embedding / MongoDB pipeline serves the
+whole run. Progress is appended to a checkpoint file; running the same
+command again skips files that were already indexed and have not changed
+since, so an interrupted backfill resumes where it left off.
+
+Usage:
+    uv run scripts/index_directory.py path/to/archive
+    uv run scripts/index_directory.py path/to/archive --workers 8 --checkpoint archive.checkpoint.jsonl
+"""
+import os
+import sys
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+# Add project root to sys.path to allow imports from app/ and scripts/
+root_dir = Path(__file__).resolve().parent.parent
+if str(root_dir) not in sys.path:
+    sys.path.append(str(root_dir))
+
+from docling_core.types.doc import DoclingDocument
+from app.api.uploader import convert_file, index_document, new_process_pool
+from app.database import MongoManager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".pptx", ".xlsx", ".html", ".htm", ".md", ".adoc", ".png", ".jpg", ".jpeg", ".tiff"}
+
+def find_documents(directory: Path):
+    """Yields (path, source) for supported files; the source is the path relative to `directory`."""
+    for path in sorted(directory.rglob("*")):
+        if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS:
+            yield path, path.relative_to(directory).as_posix()
+
+def file_signature(path: Path) -> dict:
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+class Checkpoint:
+    """
+    Append-only JSON-lines log of processed files. The last record per
+    source wins; a source counts as done if it was indexed from a file with
+    the same size and modification time.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line of an interrupted run
+                    self.records[record["source"]] = record
+
+    def is_done(self, source: str, signature: dict) -> bool:
+        record = self.records.get(source)
+        return (
+            record is not None and record["status"] == "done"
+            and record["size"] == signature["size"] and record["mtime"] == signature["mtime"]
+        )
+
+    def record(self, source: str, signature: dict, status: str, **fields):
+        record = {"source": source, **signature, "status": status, "at": time.time(), **fields}
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            self.records[source] = record
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+def index_directory(directory: str, workers: int, index_workers: int, checkpoint_path: str):
+    directory = Path(directory).resolve()
+    if not directory.is_dir():
+        print(f"Error: {directory} is not a directory.")
+        return
+
+    checkpoint = Checkpoint(checkpoint_path)
+    pending = []
+    skipped = 0
+    for path, source in find_documents(directory):
+        signature = file_signature(path)
+        if checkpoint.is_done(source, signature):
+            skipped += 1
+        else:
+            pending.append((path, source, signature))
+    print(f"{len(pending)} files to index, {skipped} already done according to {checkpoint_path}.")
+    if not pending:
+        return
+
+    mongo = MongoManager()
+    if not mongo.connect():
+        print("Failed to connect to MongoDB. Exiting.")
+        return
+    mongo.ensure_vector_indexes(dimensions=1536)
+
+    stats = {"done": 0, "failed": 0, "chunks": 0}
+    stats_lock = threading.Lock()
+    start = time.perf_counter()
+
+    def count(outcome, chunks=0):
+        with stats_lock:
+            stats[outcome] += 1
+            stats["chunks"] += chunks
+
+    def index_converted(doc_dict, source, signature):
+        try:
+            result = index_document(DoclingDocument.model_validate(doc_dict), source, mongo, ensure_indexes=False)
+            if result["failed"] or result["errors"]:
+                raise RuntimeError(result["errors"] or result["insert_errors"])
+            chunks = result["unchanged"] + result["inserted"]
+            checkpoint.record(source, signature, "done", chunks=chunks)
+            count("done", chunks)
+        except Exception as e:
+            print(f"Indexing failed for {source}: {e}")
+            checkpoint.record(source, signature, "failed", error=str(e))
+            count("failed")
+
+    try:
+        with new_process_pool(workers) as converters, \
+                ThreadPoolExecutor(max_workers=index_workers) as indexers:
+            # Keep a bounded number of conversions in flight so memory stays flat on huge archives
+            queue = iter(pending)
+            in_flight = {}
+            indexing = []
+
+            def submit_next():
+                item = next(queue, None)
+                if item is not None:
+                    in_flight[converters.submit(convert_file, str(item[0]), False)] = item
+
+            for _ in range(workers * 2):
+                submit_next()
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, source, signature = in_flight.pop(future)
+                    submit_next()
+                    try:
+                        doc_dict, _ = future.result()
+                    except Exception as e:
+                        print(f"Conversion failed for {source}: {e}")
+                        checkpoint.record(source, signature, "failed", error=str(e))
+                        count("failed")
+                        continue
+                    indexing.append(indexers.submit(index_converted, doc_dict, source, signature))
+                    indexing = [f for f in indexing if not f.done()]
+                    # Backpressure: don't let converted documents pile up in memory
+                    while len(indexing) > index_workers * 2:
+                        wait(indexing, return_when=FIRST_COMPLETED)
+                        indexing = [f for f in indexing if not f.done()]
+
+                processed = stats["done"] + stats["failed"]
+                elapsed = time.perf_counter() - start
+                print(f"Progress: {processed}/{len(pending)} files ({processed / elapsed:.2f} files/s), {stats['chunks']} chunks")
+    finally:
+        mongo.close()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Finished in {elapsed:.1f}s: {stats['done']} indexed, {stats['failed']} failed, "
+        f"{stats['chunks']} chunks. Re-run to retry failed files."
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index every document under a directory")
+    parser.add_argument("directory", help="Directory to walk recursively")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Conversion processes")
+    parser.add_argument("--index-workers", type=int, default=2, help="Documents chunked/embedded/inserted concurrently")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <directory>/.index-checkpoint.jsonl)")
+    args = parser.parse_args()
+
+    index_directory(
+        args.directory,
+        workers=args.workers,
+        index_workers=args.index_workers,
+        checkpoint_path=args.checkpoint or os.path.join(args.directory, ".index-checkpoint.jsonl")
+    )
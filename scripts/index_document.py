@@ -7,9 +7,7 @@ root_dir = Path(__file__).resolve().parent.parent
 if str(root_dir) not in sys.path:
     sys.path.append(str(root_dir))
 
-from docling.document_converter import DocumentConverter
-from scripts.chunking import get_docling_chunker, chunk_document, get_contextualized_text
-from app.embedding import get_embedding
+from app.api.uploader import get_converter, save_vector_chunks
 from app.database import MongoManager
 from dotenv import load_dotenv
 
@@ -29,67 +27,12 @@ def index_pdf(file_path: str):
     try:
         # 2. Convert PDF to Docling document
         print(f"Converting {file_path}...")
-        converter = DocumentConverter()
-        result = converter.convert(file_path)
+        result = get_converter().convert(file_path)
         doc = result.document
 
-        # 3. Chunk the document
-        print("Chunking document...")
-        chunker = get_docling_chunker()
-        chunks = list(chunk_document(doc, chunker))
-        print(f"Found {len(chunks)} chunks.")
-
-        # 4. Ensure Vector Index exists
-        print("Ensuring vector index exists...")
-        # Gemini embeddings are 1536 dimensions
-        # Check if we need to adjust dimensions based on the actual vector length
-        mongo.create_vector_index(dimensions=1536)
-
-        # 5. Process each chunk
-        for i, chunk in enumerate(chunks):
-            print(f"Processing chunk {i+1}/{len(chunks)}...", end="\r")
-            
-            # Get context-enriched text for embedding
-            enriched_text = get_contextualized_text(chunk, chunker)
-            
-            # Generate embedding using Gemini
-            raw_vector = get_embedding(enriched_text)
-            
-            # Convert to BSON Binary vector for MongoDB 8.0
-            vector = mongo.to_bson_vector(raw_vector)
-            
-            # Prepare metadata and sanitize for MongoDB (handle potential large ints)
-            metadata = chunk.meta.model_dump()
-            
-            # Helper to sanitize dict values for MongoDB
-            def sanitize_metadata(d):
-                if isinstance(d, dict):
-                    return {k: sanitize_metadata(v) for k, v in d.items()}
-                elif isinstance(d, list):
-                    return [sanitize_metadata(v) for v in d]
-                elif isinstance(d, int):
-                    # MongoDB 8 supports Int64, but if it exceeds that, cast to string
-                    if d > 9223372036854775807 or d < -9223372036854775808:
-                        return str(d)
-                    return d
-                return d
-
-            sanitized_meta = sanitize_metadata(metadata)
-            
-            # Prepare data for MongoDB
-            document_data = {
-                "text": chunk.text,
-                "enriched_text": enriched_text,
-                "vector": vector,
-                "metadata": sanitized_meta,
-                "source": os.path.basename(file_path),
-                "chunk_index": i
-            }
-            
-            # Insert into MongoDB
-            mongo.insert_chunk(document_data)
-        
-        print(f"\nSuccessfully indexed {len(chunks)} chunks from {file_path} into MongoDB.")
+        # 3. Chunk, diff against stored chunks, embed new ones and insert.
+        # Shares the uploader pipeline so re-indexing a file only touches changed chunks.
+        save_vector_chunks(doc, os.path.basename(file_path), mongo)
 
     except Exception as e:
         print(f"\nAn error occurred during indexing: {e}")
@@ -99,10 +42,14 @@ def index_pdf(file_path: str):
 if __name__ == "__main__":
     import sys
     
-    # Default file path
-    default_pdf = "walmart relocation.pdf"
-    
-    # Use command line argument if provided, otherwise use default
-    pdf_file = sys.argv[1] if len(sys.argv) > 1 else default_pdf
-    
-    index_pdf(pdf_file)
+    if len(sys.argv) < 2:
+        print("Usage: index_document.py <file>  (use index_directory.py for folders)")
+        sys.exit(1)
+
+    target = sys.argv[1]
+    if os.path.isdir(target):
+        from scripts.index_directory import index_directory
+        index_directory(target, workers=os.cpu_count() or 2, index_workers=2,
+                        checkpoint_path=os.path.join(target, ".index-checkpoint.jsonl"))
+    else:
+        index_pdf(target)